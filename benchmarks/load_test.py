@@ -0,0 +1,413 @@
+"""Offline load test: how many concurrent calls one server worker sustains.
+
+Starts the mock Realtime API (mock_realtime.py) and the mock AgriSense backend
+(mock_agrisense.py) in this process, runs ``main:app`` under uvicorn in a subprocess pointed at
+them, then opens N simulated Twilio ``/media-stream`` connections. Each one replays 8 kHz μ-law
+audio (a recording, or a synthetic call) at real-time pacing in 20 ms frames, echoes marks as a
+real-time playback clock reaches them, and honours ``clear``.
+
+Reported per run:
+
+- inbound frame jitter: how far the spacing of audio frames arriving at the Realtime mock
+  drifts from 20 ms after passing through the server (the client's own send lateness is shown
+  alongside so a saturated load generator is visible);
+- time to first audio: from the mock's ``speech_stopped`` to the first response frame reaching
+  the simulated caller, split into plain turns and turns that called a tool;
+- with ``--reason``, time to first greeting: calls are placed as outbound calls with that reason,
+  whose callers wait for the assistant to speak first, and this is measured from the ``start``
+  event to the first greeting frame, along with the number of ``session.update`` events per call;
+- playback gaps: response audio that reached the caller after its playback buffer ran dry;
+- audio cleared: response audio the caller had received but not yet heard when a ``clear`` arrived;
+- server CPU and resident memory, total and per call (read from /proc, so Linux only);
+- server-side relay and event loop figures scraped from ``/metrics``.
+
+    python benchmarks/load_test.py --calls 20 --duration 30 [--audio recording.wav]
+
+``--max-ttfa-p95-ms`` and ``--max-jitter-p99-ms`` turn the run into a regression gate: the
+script exits with status 1 when either is exceeded.
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import main  # noqa: E402
+from mock_agrisense import start_mock_agrisense  # noqa: E402
+from mock_realtime import MockRealtimeServer, RealtimeScript  # noqa: E402
+from silence_gate_benchmark import synthetic_call  # noqa: E402
+
+FRAME_MS = 20
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# A gap in playback shorter than this is an underrun inside a response, not the end of one
+PLAYBACK_GAP_LIMIT = 0.5
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize_ms(values: list[float]) -> str:
+    if not values:
+        return "n/a"
+    return (f"p50 {percentile(values, 0.5) * 1000:7.2f}  p95 {percentile(values, 0.95) * 1000:7.2f}  "
+            f"p99 {percentile(values, 0.99) * 1000:7.2f}  max {max(values) * 1000:7.2f} ms  (n={len(values)})")
+
+
+class SimulatedCall:
+    """A Twilio Media Streams client for one call."""
+
+    def __init__(self, index: int, frames: list[str], duration: float, reason: str = None):
+        self.phone_number = f"+88017{index:08d}"
+        self.reason = reason
+        self.stream_sid = f"MZloadtest{index:022d}"
+        self.frames = frames
+        self.duration = duration
+        self.media_arrivals: list[float] = []
+        self.send_lateness: list[float] = []
+        self.playback_gaps: list[float] = []
+        self.playback_end = 0.0
+        self.clears = 0
+        self.cleared_audio: list[float] = []
+        self.started_at = None
+        self.first_greeting = None
+        self.greeting_heard = asyncio.Event()
+        self.error = None
+        self._mark_tasks: set[asyncio.Task] = set()
+
+    async def run(self, url: str):
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+                parameters = {"phone_number": self.phone_number}
+                if self.reason:
+                    parameters["reason"] = self.reason
+                self.started_at = time.perf_counter()
+                await ws.send(json.dumps({
+                    "event": "start",
+                    "start": {
+                        "streamSid": self.stream_sid,
+                        "callSid": self.stream_sid.replace("MZ", "CA"),
+                        "customParameters": parameters,
+                        "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1},
+                    },
+                    "streamSid": self.stream_sid,
+                }))
+                reader = asyncio.create_task(self.receive(ws))
+                try:
+                    if self.reason:
+                        # An outbound caller listens to the greeting before saying anything
+                        try:
+                            await asyncio.wait_for(self.greeting_heard.wait(), timeout=5)
+                        except asyncio.TimeoutError:
+                            pass
+                    await self.send_audio(ws)
+                    await ws.send(json.dumps({"event": "stop", "streamSid": self.stream_sid}))
+                finally:
+                    reader.cancel()
+                    for task in self._mark_tasks:
+                        task.cancel()
+        except (OSError, websockets.WebSocketException) as e:
+            self.error = repr(e)
+
+    async def send_audio(self, ws):
+        started = time.perf_counter()
+        total_frames = int(self.duration * 1000 / FRAME_MS)
+        for number, payload in zip(range(total_frames), itertools.cycle(self.frames)):
+            due = started + number * FRAME_MS / 1000
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.send_lateness.append(max(0.0, -delay))
+            await ws.send(
+                '{"event":"media","streamSid":"%s","media":{"timestamp":"%d","payload":"%s"}}'
+                % (self.stream_sid, number * FRAME_MS, payload)
+            )
+
+    async def receive(self, ws):
+        async for message in ws:
+            data = json.loads(message)
+            now = time.perf_counter()
+            if data["event"] == "media":
+                self.media_arrivals.append(now)
+                if self.first_greeting is None:
+                    self.first_greeting = now - self.started_at
+                    self.greeting_heard.set()
+                if 0 < now - self.playback_end < PLAYBACK_GAP_LIMIT:
+                    self.playback_gaps.append(now - self.playback_end)
+                duration = len(base64.b64decode(data["media"]["payload"])) / 8000
+                self.playback_end = max(now, self.playback_end) + duration
+            elif data["event"] == "mark":
+                name = data["mark"]["name"]
+                task = asyncio.create_task(self.echo_mark(ws, name, self.playback_end - now), name=name)
+                self._mark_tasks.add(task)
+                task.add_done_callback(self._mark_tasks.discard)
+            elif data["event"] == "clear":
+                # Twilio drops buffered audio and immediately returns the marks it skipped
+                self.clears += 1
+                self.cleared_audio.append(max(0.0, self.playback_end - now))
+                self.playback_end = now
+                for task in list(self._mark_tasks):
+                    task.cancel()
+                    await self.send_mark(ws, task.get_name())
+
+    async def echo_mark(self, ws, name: str, delay: float):
+        await asyncio.sleep(max(0.0, delay))
+        await self.send_mark(ws, name)
+
+    async def send_mark(self, ws, name: str):
+        try:
+            await ws.send(json.dumps({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": name}}))
+        except websockets.ConnectionClosed:
+            pass
+
+
+class ServerProcess:
+    """main:app under uvicorn in a child process, with CPU and memory sampling from /proc."""
+
+    def __init__(self, port: int, env: dict, show_log: bool):
+        self.port = port
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=REPO_ROOT,
+            env=env,
+            stdout=None if show_log else subprocess.DEVNULL,
+            stderr=None if show_log else subprocess.DEVNULL,
+        )
+        self.peak_rss = 0
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError):
+            return None
+
+    def rss_bytes(self):
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    async def sample_memory(self):
+        while True:
+            rss = self.rss_bytes()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss, rss)
+            await asyncio.sleep(0.25)
+
+    async def wait_ready(self, timeout: float = 20):
+        deadline = time.monotonic() + timeout
+        async with aiohttp.ClientSession() as session:
+            while time.monotonic() < deadline:
+                if self.process.poll() is not None:
+                    raise RuntimeError("server exited during startup; rerun with --server-log")
+                try:
+                    async with session.get(f"http://127.0.0.1:{self.port}/stats") as response:
+                        if response.status == 200:
+                            return
+                except aiohttp.ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError("server did not become ready")
+
+    async def scrape_metrics(self) -> list[str]:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{self.port}/metrics") as response:
+                return (await response.text()).splitlines()
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def histogram_quantile(lines: list[str], name: str, q: float, label: str = "") -> float:
+    """Estimate a quantile from Prometheus histogram buckets, as histogram_quantile() would."""
+    buckets = []
+    for line in lines:
+        if line.startswith(f"{name}_bucket{{") and label in line:
+            bound = line.split('le="', 1)[1].split('"', 1)[0]
+            buckets.append((float(bound), float(line.rsplit(" ", 1)[1])))
+    if not buckets or buckets[-1][1] == 0:
+        return float("nan")
+    rank = q * buckets[-1][1]
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / max(count - lower_count, 1)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def report(calls: list[SimulatedCall], realtime: MockRealtimeServer, cpu_used, wall: float,
+           baseline_rss, peak_rss: int, metrics: list[str]) -> dict:
+    sessions = realtime.sessions_by_phone()
+    jitter, lateness, ttfa_plain, ttfa_tool, gaps = [], [], [], [], []
+    for call in calls:
+        lateness.extend(call.send_lateness)
+        gaps.extend(call.playback_gaps)
+        session = sessions.get(call.phone_number)
+        if session is None:
+            continue
+        jitter.extend(abs(later - earlier - FRAME_MS / 1000)
+                      for earlier, later in zip(session.append_times, session.append_times[1:]))
+        arrivals = iter(call.media_arrivals)
+        arrival = next(arrivals, None)
+        for stopped_at, used_tool in session.speech_stopped_times:
+            while arrival is not None and arrival < stopped_at:
+                arrival = next(arrivals, None)
+            if arrival is None:
+                break
+            (ttfa_tool if used_tool else ttfa_plain).append(arrival - stopped_at)
+
+    failed = [call for call in calls if call.error]
+    print(f"calls:                 {len(calls)} ({len(failed)} failed)")
+    for call in failed[:5]:
+        print(f"  {call.phone_number}: {call.error}")
+    print(f"inbound frame jitter:  {summarize_ms(jitter)}")
+    print(f"client send lateness:  {summarize_ms(lateness)}")
+    print(f"time to first audio:   {summarize_ms(ttfa_plain)}")
+    print(f"  turns with a tool:   {summarize_ms(ttfa_tool)}")
+    if any(call.reason for call in calls):
+        greetings = [call.first_greeting for call in calls if call.first_greeting is not None]
+        updates = [session.session_updates for session in sessions.values()]
+        print(f"time to greeting:      {summarize_ms(greetings)}")
+        print(f"  session.update sent: {sum(updates) / max(len(updates), 1):.1f} per call")
+    output_chars = [chars for session in sessions.values() for chars in session.tool_output_chars]
+    if output_chars:
+        print(f"tool output size:      {sum(output_chars) / len(output_chars):.0f} chars on average (n={len(output_chars)})")
+    print(f"playback gaps:         {len(gaps)} ({sum(gaps) * 1000:.0f} ms total), "
+          f"{sum(call.clears for call in calls)} clears, "
+          f"{sum(session.truncations for session in sessions.values())} truncations")
+    print(f"audio cleared:         {summarize_ms([seconds for call in calls for seconds in call.cleared_audio])}")
+    if cpu_used is not None:
+        cpu_share = cpu_used / wall
+        print(f"server CPU:            {cpu_share:.1%} of one core, {cpu_share / max(len(calls), 1):.2%} per call")
+    else:
+        print("server CPU:            n/a (no /proc)")
+    if baseline_rss is not None:
+        growth = peak_rss - baseline_rss
+        print(f"server memory:         {baseline_rss / 2**20:.1f} MiB idle, {peak_rss / 2**20:.1f} MiB peak, "
+              f"{growth / max(len(calls), 1) / 2**10:.0f} KiB per call")
+    else:
+        print("server memory:         n/a (no /proc)")
+    for direction in ("inbound", "outbound"):
+        p99 = histogram_quantile(metrics, "voice_relay_frame_seconds", 0.99, f'direction="{direction}"')
+        print(f"server relay p99 {direction + ':':9} {p99 * 1e6:.1f} µs per frame")
+    print(f"server loop lag p99:   {histogram_quantile(metrics, 'voice_event_loop_lag_seconds', 0.99) * 1000:.2f} ms")
+    return {"ttfa_p95": percentile(ttfa_plain + ttfa_tool, 0.95), "jitter_p99": percentile(jitter, 0.99), "failed": len(failed)}
+
+
+async def run(args) -> int:
+    if args.audio:
+        audio = main.load_mulaw_audio(args.audio)
+    else:
+        audio = synthetic_call(seconds=20)
+    frames = main.split_mulaw_frames(audio, FRAME_MS)
+
+    realtime = MockRealtimeServer(RealtimeScript(
+        tool_every=args.tool_every, interrupt_every=args.interrupt_every, prefill_ms_per_kchar=args.prefill_ms_per_kchar,
+        session_update_ms=args.session_update_ms,
+    ))
+    await realtime.start("127.0.0.1", args.realtime_port)
+    backend = await start_mock_agrisense("127.0.0.1", args.backend_port, args.backend_latency_ms, args.backend_jitter_ms)
+
+    env = dict(os.environ)
+    env["OPENAI_REALTIME_URL"] = f"ws://127.0.0.1:{args.realtime_port}/v1/realtime"
+    env["AGRISENSE_BASE_URL"] = f"http://127.0.0.1:{args.backend_port}"
+    env["OPENAI_API_KEY"] = "benchmark"
+    env["PUBLIC_URL"] = f"http://127.0.0.1:{args.server_port}"
+    server = ServerProcess(args.server_port, env, args.server_log)
+    sampler = None
+    try:
+        await server.wait_ready()
+        await asyncio.sleep(1)
+        baseline_rss = server.rss_bytes()
+        sampler = asyncio.create_task(server.sample_memory())
+        cpu_before = server.cpu_seconds()
+        started = time.perf_counter()
+
+        calls = [SimulatedCall(index, frames, args.duration, args.reason) for index in range(args.calls)]
+        url = f"ws://127.0.0.1:{args.server_port}/media-stream"
+
+        async def start_call(call: SimulatedCall, delay: float):
+            await asyncio.sleep(delay)
+            await call.run(url)
+
+        ramp_step = args.ramp / args.calls if args.calls else 0
+        await asyncio.gather(*(start_call(call, index * ramp_step) for index, call in enumerate(calls)))
+
+        wall = time.perf_counter() - started
+        cpu_after = server.cpu_seconds()
+        cpu_used = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+        metrics = await server.scrape_metrics()
+        result = report(calls, realtime, cpu_used, wall, baseline_rss, server.peak_rss, metrics)
+    finally:
+        if sampler:
+            sampler.cancel()
+        server.stop()
+        await realtime.close()
+        await backend.cleanup()
+
+    exit_code = 0
+    if result["failed"]:
+        exit_code = 1
+    if args.max_ttfa_p95_ms is not None and not result["ttfa_p95"] * 1000 <= args.max_ttfa_p95_ms:
+        print(f"FAIL: time to first audio p95 above {args.max_ttfa_p95_ms} ms")
+        exit_code = 1
+    if args.max_jitter_p99_ms is not None and not result["jitter_p99"] * 1000 <= args.max_jitter_p99_ms:
+        print(f"FAIL: inbound frame jitter p99 above {args.max_jitter_p99_ms} ms")
+        exit_code = 1
+    return exit_code
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=10, help="number of concurrent simulated calls")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of audio each call sends")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which calls are started")
+    parser.add_argument("--audio", help="8 kHz μ-law recording (WAV or raw) to replay; synthetic if omitted")
+    parser.add_argument("--backend-latency-ms", type=float, default=300)
+    parser.add_argument("--backend-jitter-ms", type=float, default=100)
+    parser.add_argument("--tool-every", type=int, default=3, help="every Nth response calls get_farmer_data")
+    parser.add_argument("--interrupt-every", type=int, default=5, help="every Nth response is barged in on")
+    parser.add_argument("--prefill-ms-per-kchar", type=float, default=25.0,
+                        help="modelled delay before the mock answers, per 1000 characters of tool output")
+    parser.add_argument("--session-update-ms", type=float, default=0.0,
+                        help="modelled time the mock takes to apply each session.update")
+    parser.add_argument("--reason", help="place outbound calls with this reason and report time to first greeting")
+    parser.add_argument("--server-port", type=int, default=5099)
+    parser.add_argument("--realtime-port", type=int, default=8766)
+    parser.add_argument("--backend-port", type=int, default=8765)
+    parser.add_argument("--server-log", action="store_true", help="show the server's output")
+    parser.add_argument("--max-ttfa-p95-ms", type=float, help="fail if time to first audio p95 exceeds this")
+    parser.add_argument("--max-jitter-p99-ms", type=float, help="fail if inbound frame jitter p99 exceeds this")
+    return parser
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(build_parser().parse_args())))
@@ -0,0 +1,144 @@
+"""Local stand-in for the AgriSense backend used by the load test.
+
+Serves the tool endpoints with canned JSON after a configurable delay so tool calls can be
+exercised without network access. Write requests repeating an ``Idempotency-Key`` already seen
+are counted in ``app["duplicate_writes"]``.
+
+    python benchmarks/mock_agrisense.py [--port 8765] [--latency-ms 300] [--jitter-ms 100]
+"""
+import argparse
+import asyncio
+import math
+import random
+
+from aiohttp import web
+
+CROPS = (
+    "rice", "wheat", "corn", "jute", "potato", "onion", "garlic", "lentil", "mustard", "sugarcane",
+    "tomato", "brinjal", "cabbage", "cauliflower", "chili", "pumpkin", "cucumber", "okra", "spinach", "radish",
+    "mango", "banana", "jackfruit", "litchi", "guava", "papaya", "pineapple", "watermelon", "coconut", "betel leaf",
+)
+
+
+def build_farmer_data(days: int = 7) -> dict:
+    """Return a farmer record shaped like the real one: profile, hourly sensor history, weather and NDVI."""
+    rng = random.Random(11)
+    start = 1_760_000_000
+    sensors = [
+        {
+            "timestamp": f"2025-10-{1 + hour // 24:02d}T{hour % 24:02d}:00:00Z",
+            "soil_moisture": 34 - hour * 0.04 + rng.uniform(-1.5, 1.5),
+            "soil_temperature": 26 + 3 * math.sin(hour / 24 * 2 * math.pi) + rng.uniform(-0.4, 0.4),
+            "air_temperature": 29 + 4 * math.sin(hour / 24 * 2 * math.pi) + rng.uniform(-0.6, 0.6),
+            "humidity": 78 + rng.uniform(-6, 6),
+            "ph": 6.4 + rng.uniform(-0.08, 0.08),
+            "deviceId": "ESP32-4F2A91",
+            "createdAt": f"2025-10-{1 + hour // 24:02d}T{hour % 24:02d}:00:05.123Z",
+        }
+        for hour in range(days * 24)
+    ]
+    forecast = [
+        {
+            "dt": start + hour * 3 * 3600,
+            "temp": 28 + 3 * math.sin(hour / 8 * 2 * math.pi) + rng.uniform(-0.5, 0.5),
+            "feels_like": 31 + 3 * math.sin(hour / 8 * 2 * math.pi) + rng.uniform(-0.5, 0.5),
+            "humidity": 75 + rng.uniform(-8, 8),
+            "wind_speed": 2.5 + rng.uniform(0, 2.5),
+            "rain_probability": max(0.0, min(1.0, 0.2 + (0.6 if 12 <= hour <= 20 else 0) + rng.uniform(-0.15, 0.15))),
+            "description": "light rain" if 12 <= hour <= 20 else "scattered clouds",
+            "icon": "10d" if 12 <= hour <= 20 else "03d",
+        }
+        for hour in range(40)
+    ]
+    return {
+        "_id": "652f0c9e8b3e4a0012a4c5d1",
+        "name": "Load Test Farmer",
+        "phone": "+8801700000000",
+        "location": {"district": "Rajshahi", "upazila": "Paba", "latitude": 24.3745123, "longitude": 88.6042456},
+        "land_size_acres": 2.5,
+        "crops": [{"name": "rice", "variety": "BRRI dhan49", "planted_on": "2025-07-20", "stage": "flowering"}],
+        "sensors": sensors,
+        "weather": {"current": forecast[0], "forecast": forecast},
+        "satellite": {
+            "ndvi": [0.31 + 0.005 * week + rng.uniform(-0.02, 0.02) for week in range(52)],
+            "geometry": {"type": "Polygon", "coordinates": [[[88.6 + rng.random() / 100, 24.37 + rng.random() / 100] for _ in range(64)]]},
+            "image_url": "https://example.invalid/tiles/ndvi/latest.png",
+        },
+        "selling_list": [
+            {"_id": f"00000000-0000-0000-0000-{index:012d}", "product_name": crop, "unit_price": 40 + index * 3,
+             "unit": "kg", "description": f"Fresh {crop} from Paba", "createdAt": "2025-10-01T08:00:00Z", "__v": 0}
+            for index, crop in enumerate(("rice", "mango", "potato"))
+        ],
+        "createdAt": "2024-02-11T10:21:44.120Z",
+        "updatedAt": "2025-10-07T23:59:01.001Z",
+        "__v": 3,
+    }
+
+
+def build_market_prices() -> dict:
+    rng = random.Random(5)
+    return {
+        "prices": [
+            {"crop": crop, "market": market, "min_price": round(price * 0.9, 2), "max_price": round(price * 1.1, 2),
+             "price": price, "unit": "kg", "currency": "BDT", "updatedAt": "2025-10-08T06:00:00.000Z"}
+            for crop in CROPS
+            for market, price in (("Rajshahi", rng.uniform(20, 120)), ("Dhaka Kawran Bazar", rng.uniform(25, 140)))
+        ]
+    }
+
+
+FARMER_DATA = build_farmer_data()
+MARKET_PRICES = build_market_prices()
+
+
+def create_app(latency_ms: float = 300, jitter_ms: float = 100) -> web.Application:
+    """Return an aiohttp app answering every tool endpoint after latency_ms ± jitter_ms."""
+    app = web.Application()
+    app["requests"] = 0
+    app["idempotency_keys"] = set()
+    app["duplicate_writes"] = 0
+
+    def respond(payload: dict):
+        async def handler(request: web.Request) -> web.Response:
+            app["requests"] += 1
+            idempotency_key = request.headers.get("Idempotency-Key")
+            if idempotency_key:
+                if idempotency_key in app["idempotency_keys"]:
+                    app["duplicate_writes"] += 1
+                app["idempotency_keys"].add(idempotency_key)
+            delay = max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000
+            await asyncio.sleep(delay)
+            return web.json_response(payload)
+        return handler
+
+    app.router.add_post("/api/voice/get-farmer-data", respond(FARMER_DATA))
+    app.router.add_get("/api/prices/public", respond(MARKET_PRICES))
+    app.router.add_post("/api/voice/add-product-by-phone", respond({"success": True, "id": "00000000-0000-0000-0000-000000000002"}))
+    app.router.add_post("/api/voice/delete-product-by-phone", respond({"success": True}))
+    return app
+
+
+async def start_mock_agrisense(host: str, port: int, latency_ms: float = 300, jitter_ms: float = 100) -> web.AppRunner:
+    """Start the mock backend and return its runner; call runner.cleanup() to stop it."""
+    runner = web.AppRunner(create_app(latency_ms, jitter_ms), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def main(args):
+    await start_mock_agrisense(args.host, args.port, args.latency_ms, args.jitter_ms)
+    print(f"Mock AgriSense backend listening on http://{args.host}:{args.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=100)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
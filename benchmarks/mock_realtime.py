@@ -0,0 +1,205 @@
+"""Local stand-in for the OpenAI Realtime API used by the load test.
+
+Each connection follows a script driven by the caller audio it receives, so turns line up with
+the real-time pacing of the simulated Twilio client:
+
+- every ``turn_ms`` of input audio the caller "speaks": ``input_audio_buffer.speech_started``,
+  then ``speech_stopped`` and ``committed`` after ``speech_ms``, followed by a response;
+- every ``tool_every``-th response is a ``response.function_call_arguments.done`` for
+  ``get_farmer_data``, and the audio answer follows the server's ``response.create``;
+- every ``interrupt_every``-th response is long enough that the next turn barges in on it;
+- audio is streamed as ``response.output_audio.delta`` events faster than real time, as the
+  real API does, after a delay proportional to the tool output the model has to read;
+- each ``session.update`` holds up the events behind it for ``session_update_ms``, standing in
+  for the time the real API takes to apply a new session.
+
+Point the server at it with ``OPENAI_REALTIME_URL=ws://127.0.0.1:8766``.
+
+    python benchmarks/mock_realtime.py [--port 8766]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import re
+import time
+import uuid
+from dataclasses import dataclass
+
+import websockets
+
+PHONE_NUMBER_PATTERN = re.compile(r"phone number is (\+?\d+)")
+
+
+@dataclass
+class RealtimeScript:
+    turn_ms: int = 4000
+    speech_ms: int = 1200
+    response_ms: int = 2000
+    delta_ms: int = 40
+    # How much faster than real time response audio is generated
+    generation_speed: float = 4.0
+    tool_every: int = 3
+    interrupt_every: int = 5
+    # Modelled extra delay before audio for each 1000 characters of tool output the model must read
+    prefill_ms_per_kchar: float = 25.0
+    session_update_ms: float = 0.0
+
+
+class ScriptedRealtimeSession:
+    """One fake Realtime connection and the timings recorded for it."""
+
+    def __init__(self, ws, script: RealtimeScript):
+        self.ws = ws
+        self.script = script
+        self.phone_number = None
+        self.input_ms = 0
+        self.turns = 0
+        self.responses = 0
+        self.response_task = None
+        # Measurements read by the load test
+        self.append_times: list[float] = []
+        self.speech_stopped_times: list[tuple[float, bool]] = []
+        self.truncations = 0
+        self.tool_outputs = 0
+        self.tool_output_chars: list[int] = []
+        self.session_updates = 0
+        self.pending_prefill_ms = 0.0
+
+    async def send(self, event: dict):
+        await self.ws.send(json.dumps(event))
+
+    async def run(self):
+        await self.send({"type": "session.created", "session": {"id": f"sess_{uuid.uuid4().hex[:12]}"}})
+        try:
+            async for message in self.ws:
+                await self.handle_event(json.loads(message))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if self.response_task:
+                self.response_task.cancel()
+
+    async def handle_event(self, event: dict):
+        event_type = event.get("type")
+        if event_type == "input_audio_buffer.append":
+            self.append_times.append(time.perf_counter())
+            previous_ms = self.input_ms
+            # Base64 of 8 kHz μ-law: 4 characters encode 3 bytes, i.e. 3/8 ms of audio
+            self.input_ms += len(event["audio"]) * 3 // 4 // 8
+            await self.advance_turn(previous_ms, self.input_ms)
+        elif event_type == "session.update":
+            self.session_updates += 1
+            if self.script.session_update_ms:
+                await asyncio.sleep(self.script.session_update_ms / 1000)
+            match = PHONE_NUMBER_PATTERN.search(event.get("session", {}).get("instructions") or "")
+            if match:
+                self.phone_number = match.group(1)
+            await self.send({"type": "session.updated", "session": event.get("session", {})})
+        elif event_type == "conversation.item.create":
+            if event.get("item", {}).get("type") == "function_call_output":
+                self.tool_outputs += 1
+                output_chars = len(event["item"].get("output", ""))
+                self.tool_output_chars.append(output_chars)
+                self.pending_prefill_ms += output_chars / 1000 * self.script.prefill_ms_per_kchar
+        elif event_type == "conversation.item.truncate":
+            self.truncations += 1
+        elif event_type == "response.create":
+            self.start_response(audio_only=True)
+
+    async def advance_turn(self, previous_ms: int, current_ms: int):
+        turn_ms = self.script.turn_ms
+        turn_start = (current_ms // turn_ms) * turn_ms
+        if previous_ms < turn_start <= current_ms or previous_ms == 0 < current_ms:
+            self.turns += 1
+            if self.response_task and not self.response_task.done():
+                self.response_task.cancel()
+            await self.send({"type": "input_audio_buffer.speech_started", "audio_start_ms": current_ms, "item_id": self._item_id()})
+        stop_at = turn_start + self.script.speech_ms
+        if previous_ms < stop_at <= current_ms:
+            item_id = self._item_id()
+            self.speech_stopped_times.append((time.perf_counter(), self.turns % self.script.tool_every == 0))
+            await self.send({"type": "input_audio_buffer.speech_stopped", "audio_end_ms": current_ms, "item_id": item_id})
+            await self.send({"type": "input_audio_buffer.committed", "item_id": item_id})
+            self.start_response(audio_only=False)
+
+    def start_response(self, audio_only: bool):
+        if self.response_task and not self.response_task.done():
+            self.response_task.cancel()
+        self.response_task = asyncio.create_task(self.respond(audio_only))
+
+    async def respond(self, audio_only: bool):
+        self.responses += 1
+        response_id = f"resp_{uuid.uuid4().hex[:12]}"
+        if self.pending_prefill_ms:
+            prefill, self.pending_prefill_ms = self.pending_prefill_ms / 1000, 0.0
+            await asyncio.sleep(prefill)
+        await self.send({"type": "response.created", "response": {"id": response_id}})
+        if not audio_only and self.turns % self.script.tool_every == 0:
+            await self.send({
+                "type": "response.function_call_arguments.done",
+                "response_id": response_id,
+                "call_id": f"call_{uuid.uuid4().hex[:12]}",
+                "name": "get_farmer_data",
+                "arguments": json.dumps({"phone_number": self.phone_number or "+8801700000000"}),
+            })
+            await self.send({"type": "response.done", "response": {"id": response_id}})
+            return
+
+        response_ms = self.script.response_ms
+        if self.turns % self.script.interrupt_every == 0:
+            response_ms = self.script.turn_ms
+        item_id = self._item_id()
+        delta = base64.b64encode(bytes(range(0x80, 0x80 + 64)) * (self.script.delta_ms * 8 // 64)).decode()
+        pause = self.script.delta_ms / 1000 / self.script.generation_speed
+        for _ in range(response_ms // self.script.delta_ms):
+            await self.send({"type": "response.output_audio.delta", "response_id": response_id, "item_id": item_id, "delta": delta})
+            await asyncio.sleep(pause)
+        await self.send({"type": "response.output_audio.done", "response_id": response_id, "item_id": item_id})
+        await self.send({"type": "response.done", "response": {"id": response_id}})
+
+    @staticmethod
+    def _item_id() -> str:
+        return f"item_{uuid.uuid4().hex[:12]}"
+
+
+class MockRealtimeServer:
+    """WebSocket server that runs a ScriptedRealtimeSession per connection."""
+
+    def __init__(self, script: RealtimeScript = None):
+        self.script = script or RealtimeScript()
+        self.sessions: list[ScriptedRealtimeSession] = []
+        self._server = None
+
+    async def _handle(self, ws):
+        session = ScriptedRealtimeSession(ws, self.script)
+        self.sessions.append(session)
+        await session.run()
+
+    async def start(self, host: str, port: int):
+        self._server = await websockets.serve(self._handle, host, port, max_size=None)
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def sessions_by_phone(self) -> dict[str, ScriptedRealtimeSession]:
+        return {session.phone_number: session for session in self.sessions if session.phone_number}
+
+
+async def main(args):
+    server = MockRealtimeServer()
+    await server.start(args.host, args.port)
+    print(f"Mock Realtime API listening on ws://{args.host}:{args.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,90 @@
+"""Micro-benchmark of the per-frame CPU cost of the Twilio <-> OpenAI audio relay.
+
+Compares the original relay (full JSON parse / re-serialize and a base64 round trip)
+with the fast path in main.py. Run from the repository root:
+
+    python benchmarks/relay_benchmark.py
+"""
+import base64
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import main  # noqa: E402
+
+ITERATIONS = 50_000
+STREAM_SID = "MZ18ad3ab5a668481ce02b83e7395059f0"
+
+# A 20 ms μ-law frame from Twilio is 160 bytes; OpenAI deltas are usually larger
+TWILIO_FRAME = json.dumps({
+    "event": "media",
+    "sequenceNumber": "42",
+    "media": {
+        "track": "inbound",
+        "chunk": "41",
+        "timestamp": "820",
+        "payload": base64.b64encode(os.urandom(160)).decode(),
+    },
+    "streamSid": STREAM_SID,
+}, separators=(",", ":"))
+OPENAI_DELTA = json.dumps({
+    "type": "response.output_audio.delta",
+    "event_id": "event_CQ7xVJ2l0Kz1",
+    "response_id": "resp_CQ7xUp3T9wD2",
+    "item_id": "item_CQ7xUz4RkU3",
+    "output_index": 0,
+    "content_index": 0,
+    "delta": base64.b64encode(os.urandom(800)).decode(),
+})
+STREAM_SID_JSON = json.dumps(STREAM_SID)
+
+
+def inbound_legacy():
+    data = json.loads(TWILIO_FRAME)
+    if data['event'] == 'media':
+        int(data['media']['timestamp'])
+        json.dumps({"type": "input_audio_buffer.append", "audio": data['media']['payload']})
+
+
+def inbound_fast():
+    timestamp, payload = main.extract_twilio_media(TWILIO_FRAME)
+    main.build_openai_audio_append(payload)
+
+
+def outbound_legacy():
+    response = json.loads(OPENAI_DELTA)
+    audio_payload = base64.b64encode(base64.b64decode(response['delta'])).decode('utf-8')
+    # Starlette's send_json serializes with compact separators
+    json.dumps(
+        {"event": "media", "streamSid": STREAM_SID, "media": {"payload": audio_payload}},
+        separators=(",", ":"), ensure_ascii=False,
+    )
+
+
+def outbound_fast():
+    response = main.json_loads(OPENAI_DELTA)
+    main.build_twilio_media_message(STREAM_SID_JSON, response['delta'])
+
+
+def per_frame_us(func) -> float:
+    return min(timeit.repeat(func, number=ITERATIONS, repeat=5)) / ITERATIONS * 1e6
+
+
+def main_benchmark():
+    print(f"JSON codec: {'orjson' if main.orjson is not None else 'json (stdlib)'}")
+    print(f"{'direction':<24}{'legacy µs':>12}{'fast µs':>12}{'speedup':>10}")
+    for label, legacy, fast in (
+        ("Twilio -> OpenAI", inbound_legacy, inbound_fast),
+        ("OpenAI -> Twilio", outbound_legacy, outbound_fast),
+    ):
+        legacy_us = per_frame_us(legacy)
+        fast_us = per_frame_us(fast)
+        print(f"{label:<24}{legacy_us:>12.2f}{fast_us:>12.2f}{legacy_us / fast_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main_benchmark()
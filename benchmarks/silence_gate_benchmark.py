@@ -0,0 +1,60 @@
+"""Offline benchmark of the inbound silence gate.
+
+Replays a recorded 8 kHz μ-law call (raw μ-law or WAV) through SilenceGate in 20 ms frames and
+reports the CPU cost per frame and how much audio would not be sent to OpenAI. Without a
+recording, a synthetic call of alternating speech-like bursts and line noise is used.
+
+    python benchmarks/silence_gate_benchmark.py [recording.wav]
+"""
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import main  # noqa: E402
+
+FRAME_MS = 20
+
+
+def synthetic_call(seconds: int = 60) -> bytes:
+    """Return μ-law audio alternating 1.5 s of speech-like signal with 3 s of quiet line noise."""
+    rng = random.Random(7)
+    samples = []
+    for index in range(seconds * 8000):
+        if index % 36000 < 12000:
+            envelope = 0.5 + 0.5 * math.sin(index / 400)
+            value = envelope * (6000 * math.sin(index / 3.1) + 2500 * math.sin(index / 1.7)) + rng.gauss(0, 400)
+        else:
+            value = rng.gauss(0, 40)
+        samples.append(max(-32768, min(32767, int(value))))
+    pcm = b''.join(sample.to_bytes(2, 'little', signed=True) for sample in samples)
+    return main.linear16_to_mulaw(pcm)
+
+
+def run(audio: bytes):
+    payloads = main.split_mulaw_frames(audio, FRAME_MS)
+    gate = main.SilenceGate()
+
+    start = time.perf_counter()
+    forwarded = 0
+    for payload in payloads:
+        forwarded += len(gate.process(payload))
+    elapsed = time.perf_counter() - start
+
+    per_frame_us = elapsed / len(payloads) * 1e6
+    print(f"frames:             {len(payloads)} ({len(audio) / 8000:.1f} s of audio)")
+    print(f"forwarded frames:   {forwarded}")
+    print(f"dropped frames:     {gate.frames_dropped} ({gate.frames_dropped / len(payloads):.1%})")
+    print(f"bytes not sent:     {gate.bytes_dropped}")
+    print(f"CPU per frame:      {per_frame_us:.2f} µs ({per_frame_us / (FRAME_MS * 1000):.3%} of the {FRAME_MS} ms frame interval)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        run(main.load_mulaw_audio(sys.argv[1]))
+    else:
+        run(synthetic_call())
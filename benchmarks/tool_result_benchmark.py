@@ -0,0 +1,59 @@
+"""Benchmark of the tool result shaper.
+
+Compares the function_call_output the model receives for the mock backend's farmer record and
+price list with TOOL_RESULT_SHAPING on and off: size in characters, a rough token estimate and
+the CPU cost of shaping.
+
+    python benchmarks/tool_result_benchmark.py [--ttfa]
+
+With ``--ttfa`` it also runs the load test twice, with the shaper off and on, so the effect on
+time to first audio after a tool call can be compared. The Realtime mock models the model's
+extra reading time as a delay per 1000 characters of tool output (``--prefill-ms-per-kchar``).
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import main  # noqa: E402
+import load_test  # noqa: E402
+from mock_agrisense import FARMER_DATA, MARKET_PRICES  # noqa: E402
+
+ITERATIONS = 200
+# Rough average for JSON; real token counts depend on the tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def measure_sizes():
+    print(f"{'tool':<20}{'raw chars':>12}{'shaped chars':>15}{'~tokens saved':>15}{'shaping CPU':>14}")
+    for tool_name, data in (("get_farmer_data", FARMER_DATA), ("get_market_prices", MARKET_PRICES)):
+        tool = main.TOOL_REGISTRY[tool_name]
+        result = {"success": True, "data": data}
+        raw = json.dumps(result)
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            shaped = main.shape_tool_result(tool, result)
+        per_call_ms = (time.perf_counter() - start) / ITERATIONS * 1000
+        saved_tokens = (len(raw) - len(shaped)) // CHARS_PER_TOKEN
+        print(f"{tool_name:<20}{len(raw):>12}{len(shaped):>15}{saved_tokens:>15}{per_call_ms:>11.2f} ms")
+    print(f"budget: TOOL_RESULT_MAX_CHARS={main.TOOL_RESULT_MAX_CHARS}")
+
+
+async def compare_ttfa(args):
+    for shaping in ("false", "true"):
+        os.environ["TOOL_RESULT_SHAPING"] = shaping
+        print(f"\n--- load test with TOOL_RESULT_SHAPING={shaping} ---")
+        await load_test.run(args)
+
+
+if __name__ == "__main__":
+    measure_sizes()
+    if "--ttfa" in sys.argv:
+        sys.argv.remove("--ttfa")
+        parser = load_test.build_parser()
+        parser.set_defaults(calls=5, duration=25, tool_every=2)
+        asyncio.run(compare_ttfa(parser.parse_args()))
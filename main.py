@@ -1,18 +1,45 @@
 import os
+import sys
 import json
+import time
+import uuid
+import queue
+import atexit
+import signal
+import threading
+import shutil
+import sqlite3
+import tempfile
+import importlib
 import base64
+import random
 import asyncio
+import logging
 import websockets
 import aiohttp
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from xml.sax.saxutils import quoteattr
+from dataclasses import dataclass, field
 from typing import Optional
 from fastapi import FastAPI, WebSocket, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response, PlainTextResponse
 from fastapi.websockets import WebSocketDisconnect
 from twilio.twiml.voice_response import VoiceResponse, Connect, Say, Stream
 from twilio.rest import Client
-from pydantic import BaseModel
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-from urllib.parse import urlencode, urlparse
+from urllib.parse import urlencode, urlparse, parse_qsl
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library codec is used instead
+    orjson = None
 
 load_dotenv()
 
@@ -22,10 +49,120 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
 PORT = int(os.getenv('PORT', 5050))
+# Number of server processes started by `python main.py`; each handles its own calls
+WORKERS = int(os.getenv('WORKERS', 1))
+WORKER_ID = f"{os.uname().nodename if hasattr(os, 'uname') else 'local'}:{os.getpid()}"
+# Where cached tool responses and per-worker call counts live: memory (one worker), sqlite
+# (all workers on one host) or "package.module:factory" for a custom store
+SHARED_STORE = os.getenv('SHARED_STORE', 'sqlite' if WORKERS > 1 else 'memory')
+SHARED_STORE_PATH = os.getenv('SHARED_STORE_PATH', os.path.join(tempfile.gettempdir(), 'agrisense-voice-store.sqlite3'))
+# Admission control: live calls each worker may carry (0 = unlimited). Callers over capacity hear
+# BUSY_MESSAGE; with ADMISSION_QUEUE_SECONDS they are first put on hold and retried that long.
+MAX_ACTIVE_CALLS = int(os.getenv('MAX_ACTIVE_CALLS', 0))
+ADMISSION_QUEUE_SECONDS = int(os.getenv('ADMISSION_QUEUE_SECONDS', 0))
+HOLD_MESSAGE = os.getenv('HOLD_MESSAGE', 'All of our assistants are busy. Please stay on the line.')
+BUSY_MESSAGE = os.getenv('BUSY_MESSAGE', 'Sorry, all of our assistants are busy right now. Please call again in a few minutes.')
+# On SIGTERM new calls are turned away and calls in progress get this many seconds to finish
+DRAIN_TIMEOUT = int(os.getenv('DRAIN_TIMEOUT', 120))
+# Realtime endpoint; point this at a local mock server for testing
+OPENAI_REALTIME_URL = os.getenv('OPENAI_REALTIME_URL', 'wss://api.openai.com/v1/realtime')
+# Number of pre-opened, pre-initialized Realtime sessions to keep ready (0 disables the pool)
+OPENAI_POOL_SIZE = int(os.getenv('OPENAI_POOL_SIZE', 0))
+OPENAI_POOL_IDLE_TTL = float(os.getenv('OPENAI_POOL_IDLE_TTL', 600))
+OPENAI_POOL_HEALTH_INTERVAL = float(os.getenv('OPENAI_POOL_HEALTH_INTERVAL', 15))
+# Number of distinct call reasons whose serialized instructions are kept for reuse
+CALL_REASON_CACHE_SIZE = int(os.getenv('CALL_REASON_CACHE_SIZE', 256))
 TEMPERATURE = float(os.getenv('TEMPERATURE', 0.8))
+# Outbound campaigns: dialling rate and how many campaign calls may be live at once
+CAMPAIGN_CALLS_PER_SECOND = float(os.getenv('CAMPAIGN_CALLS_PER_SECOND', 1))
+CAMPAIGN_MAX_CONCURRENT_CALLS = int(os.getenv('CAMPAIGN_MAX_CONCURRENT_CALLS', 10))
+# A campaign call frees its slot after this many seconds even if Twilio never reports completion
+CAMPAIGN_CALL_TIMEOUT = float(os.getenv('CAMPAIGN_CALL_TIMEOUT', 900))
 # Public URL that Twilio can reach (required for outbound calls)
 # Example: https://your-domain.com or https://your-ngrok-url.ngrok.io
 PUBLIC_URL = os.getenv('PUBLIC_URL', '').rstrip('/')
+# AgriSense backend used by the tools
+AGRISENSE_BASE_URL = os.getenv('AGRISENSE_BASE_URL', 'https://agrisense-z6ks.onrender.com').rstrip('/')
+# Shared HTTP connection pool used by every tool call
+HTTP_POOL_LIMIT = int(os.getenv('HTTP_POOL_LIMIT', 100))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', 20))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', 60))
+HTTP_DNS_CACHE_TTL = int(os.getenv('HTTP_DNS_CACHE_TTL', 300))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3))
+HTTP_TOTAL_TIMEOUT = float(os.getenv('HTTP_TOTAL_TIMEOUT', 10))
+# Market prices are public and identical for every caller, so they are served from memory
+MARKET_PRICES_CACHE_TTL = float(os.getenv('MARKET_PRICES_CACHE_TTL', 60))
+MARKET_PRICES_STALE_TTL = float(os.getenv('MARKET_PRICES_STALE_TTL', 600))
+# Farmer data is prefetched when a call starts and reused by the get_farmer_data tool
+FARMER_DATA_CACHE_TTL = float(os.getenv('FARMER_DATA_CACHE_TTL', 300))
+# Cached tool responses are kept this long past fetching as a fallback while the backend is down,
+# and only the most recently fetched TOOL_CACHE_MAX_ENTRIES are kept at all
+TOOL_CACHE_RETENTION = float(os.getenv('TOOL_CACHE_RETENTION', 3600))
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv('TOOL_CACHE_MAX_ENTRIES', 1000))
+# Seconds a write tool's result is reused when the model repeats it with the same arguments in a call (0 disables)
+WRITE_DEDUP_WINDOW = float(os.getenv('WRITE_DEDUP_WINDOW', 120))
+# Maximum number of tool calls running at once for a single phone call
+MAX_CONCURRENT_TOOL_CALLS = int(os.getenv('MAX_CONCURRENT_TOOL_CALLS', 4))
+# Per-endpoint circuit breaker: consecutive failures before failing fast, and seconds before a probe
+BACKEND_BREAKER_FAILURES = int(os.getenv('BACKEND_BREAKER_FAILURES', 3))
+BACKEND_BREAKER_RESET = float(os.getenv('BACKEND_BREAKER_RESET', 30))
+# Read tools send a second, concurrent request if the first takes longer than this (0 disables)
+BACKEND_HEDGE_DELAY = float(os.getenv('BACKEND_HEDGE_DELAY', 0))
+# While calls are active the backend is pinged this often so it does not spin down (0 disables)
+BACKEND_KEEPWARM_INTERVAL = float(os.getenv('BACKEND_KEEPWARM_INTERVAL', 60))
+BACKEND_KEEPWARM_PATH = os.getenv('BACKEND_KEEPWARM_PATH', '/api/prices/public')
+# Tool results are compacted before they are sent to the model, to at most this many characters
+TOOL_RESULT_SHAPING = os.getenv('TOOL_RESULT_SHAPING', 'true').lower() in ('1', 'true', 'yes')
+TOOL_RESULT_MAX_CHARS = int(os.getenv('TOOL_RESULT_MAX_CHARS', 4000))
+# How the caller is greeted before the stream connects:
+#   say    - Twilio text-to-speech (default)
+#   play   - <Play> GREETING_AUDIO_FILE, served with long-lived cache headers from /greeting-audio
+#   stream - send GREETING_AUDIO_FILE (8 kHz mono μ-law/PCM WAV or raw μ-law) straight into the media stream
+GREETING_MODE = os.getenv('GREETING_MODE', 'say').lower()
+GREETING_AUDIO_FILE = os.getenv('GREETING_AUDIO_FILE', 'static/greeting.wav')
+# Optional local silence gate for inbound audio. Frames whose mean absolute amplitude (16-bit scale)
+# is below the threshold are not forwarded, except for the padding server_vad needs around speech.
+SILENCE_SUPPRESSION = os.getenv('SILENCE_SUPPRESSION', 'false').lower() in ('1', 'true', 'yes')
+SILENCE_THRESHOLD = int(os.getenv('SILENCE_THRESHOLD', 250))
+SILENCE_PREROLL_MS = int(os.getenv('SILENCE_PREROLL_MS', 300))
+SILENCE_HANGOVER_MS = int(os.getenv('SILENCE_HANGOVER_MS', 800))
+# Optional "please wait" clips (8 kHz WAV or raw μ-law files in FILLER_AUDIO_DIR) played while a
+# tool call is running, starting FILLER_DELAY_MS after it begins and repeating every FILLER_GAP_MS
+FILLER_AUDIO_DIR = os.getenv('FILLER_AUDIO_DIR', 'static/filler')
+FILLER_DELAY_MS = int(os.getenv('FILLER_DELAY_MS', 700))
+FILLER_GAP_MS = int(os.getenv('FILLER_GAP_MS', 2500))
+# Outbound audio deltas are coalesced into frames of at least this many milliseconds (0 disables)
+OUTBOUND_FRAME_MS = int(os.getenv('OUTBOUND_FRAME_MS', 100))
+# Audio is relayed through bounded queues, one writer task per socket. Sizes are in milliseconds of
+# audio. Outbound audio is paced to real time, kept OUTBOUND_LEAD_MS ahead of playback so that the
+# clear sent on an interruption throws away little audio Twilio had already received.
+INBOUND_QUEUE_MS = int(os.getenv('INBOUND_QUEUE_MS', 2000))
+OUTBOUND_QUEUE_MS = int(os.getenv('OUTBOUND_QUEUE_MS', 60000))
+OUTBOUND_LEAD_MS = int(os.getenv('OUTBOUND_LEAD_MS', 300))
+# What to do when a queue fills up because its socket is not keeping up:
+#   drop   - discard the oldest queued frame (default)
+#   hangup - end the call
+RELAY_SLOW_CONSUMER = os.getenv('RELAY_SLOW_CONSUMER', 'drop').lower()
+# Optional call capture: both audio directions plus transcripts and tool events, kept in memory during
+# the call (the last CAPTURE_MAX_SECONDS of audio and CAPTURE_MAX_EVENTS events) and written to
+# CAPTURE_DIR after it ends. The oldest captures are deleted once CAPTURE_RETENTION_MB is exceeded.
+CALL_CAPTURE = os.getenv('CALL_CAPTURE', 'false').lower() in ('1', 'true', 'yes')
+CAPTURE_DIR = os.getenv('CAPTURE_DIR', 'captures')
+CAPTURE_AUDIO_FORMAT = os.getenv('CAPTURE_AUDIO_FORMAT', 'wav').lower()
+CAPTURE_MAX_SECONDS = int(os.getenv('CAPTURE_MAX_SECONDS', 1800))
+CAPTURE_MAX_EVENTS = int(os.getenv('CAPTURE_MAX_EVENTS', 5000))
+CAPTURE_RETENTION_MB = int(os.getenv('CAPTURE_RETENTION_MB', 1024))
+# Transcription model for the caller's speech (e.g. gpt-4o-mini-transcribe); unset means no caller transcripts
+INPUT_TRANSCRIPTION_MODEL = os.getenv('INPUT_TRANSCRIPTION_MODEL', '')
+# Logging: records are written by a background thread; LOG_FORMAT is "text" or "json"
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+# Records beyond this many waiting to be written are dropped rather than blocking the event loop
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# Logged payloads (events, tool arguments and results) are cut to this many characters (0 = no limit)
+LOG_MAX_PAYLOAD_CHARS = int(os.getenv('LOG_MAX_PAYLOAD_CHARS', 500))
+# Per-event-type sample rates, e.g. "response.done=0.1,rate_limits.updated=0"
+LOG_SAMPLE_RATES_SETTING = os.getenv('LOG_SAMPLE_RATES', '')
 SYSTEM_MESSAGE = (
     "You are a helpful AI assistant for farmers in Bangladesh. You MUST speak in Bangla (Bengali) language. You have the callers number already so dont ask him about it"
     "You can help farmers with: checking their farm information, viewing market prices for crops, "
@@ -37,13 +174,76 @@ SYSTEM_MESSAGE = (
 )
 VOICE = 'alloy'
 
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How often a tool request is retried after a timeout, connection error or 5xx."""
+    attempts: int = 1
+    backoff: float = 0.0
+    # Only for idempotent reads: seconds after which a concurrent duplicate request is sent (0 disables)
+    hedge_after: float = 0.0
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """How long a successful tool response is fresh, and how much longer it may be served stale while refreshing."""
+    ttl: float = 0.0
+    stale_ttl: float = 0.0
+
+
+@dataclass(frozen=True)
+class ResultShape:
+    """How a tool's response data is compacted before it is sent to the model."""
+    drop_keys: frozenset = frozenset()
+    round_digits: int = 2
+    # Numeric lists and timestamped readings at least this long become latest/min/max/avg/trend
+    series_min_length: int = 6
+    # Lists of objects at least this long are sent as a column/row table
+    table_min_rows: int = 4
+    max_list_items: int = 20
+    max_string_chars: int = 300
+
+
+@dataclass(frozen=True)
+class ToolDefinition:
+    """A tool exposed to the model together with the HTTP backend that serves it."""
+    name: str
+    description: str
+    parameters: dict
+    method: str
+    endpoint: str
+    timeout: float = HTTP_TOTAL_TIMEOUT
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    cache: Optional[CachePolicy] = None
+    success_message: Optional[str] = None
+    # Cached tools whose entry for the same phone number is dropped after a successful call
+    invalidates: tuple[str, ...] = ()
+    # Writes: requests carry an Idempotency-Key, and repeats within a call are answered by the first run
+    deduplicate: bool = False
+    result_shape: ResultShape = field(default_factory=ResultShape)
+
+    @property
+    def url(self) -> str:
+        return f"{AGRISENSE_BASE_URL}{self.endpoint}"
+
+    def schema(self) -> dict:
+        """Return the function definition sent to the Realtime API."""
+        return {
+            "type": "function",
+            "name": self.name,
+            "description": self.description,
+            "parameters": self.parameters,
+        }
+
+
+# Database bookkeeping fields that are never useful to the model
+RECORD_METADATA_KEYS = frozenset({"__v", "createdAt", "updatedAt", "created_at", "updated_at"})
+
 # Tool definitions - Add more tools here as needed
-TOOLS = [
-    {
-        "type": "function",
-        "name": "get_farmer_data",
-        "description": "Retrieves detailed information about a farmer including their name, farm details, crops, and contact information using their phone number.",
-        "parameters": {
+TOOL_REGISTRY = {tool.name: tool for tool in (
+    ToolDefinition(
+        name="get_farmer_data",
+        description="Retrieves detailed information about a farmer including their name, farm details, crops, and contact information using their phone number.",
+        parameters={
             "type": "object",
             "properties": {
                 "phone_number": {
@@ -52,23 +252,36 @@ TOOLS = [
                 }
             },
             "required": ["phone_number"]
-        }
-    },
-    {
-        "type": "function",
-        "name": "get_market_prices",
-        "description": "Gets the latest market prices for crops including corn, mango, rice, and other agricultural products. Returns current market rates.",
-        "parameters": {
+        },
+        method="POST",
+        endpoint="/api/voice/get-farmer-data",
+        timeout=6,
+        retry=RetryPolicy(attempts=2, backoff=0.2, hedge_after=BACKEND_HEDGE_DELAY),
+        cache=CachePolicy(ttl=FARMER_DATA_CACHE_TTL),
+        # Imagery and field geometry mean nothing when read out on a call
+        result_shape=ResultShape(drop_keys=RECORD_METADATA_KEYS | {
+            "password", "image", "images", "imageUrl", "image_url", "thumbnail", "geometry", "polygon", "boundary", "tiles",
+        }),
+    ),
+    ToolDefinition(
+        name="get_market_prices",
+        description="Gets the latest market prices for crops including corn, mango, rice, and other agricultural products. Returns current market rates.",
+        parameters={
             "type": "object",
             "properties": {},
             "required": []
-        }
-    },
-    {
-        "type": "function",
-        "name": "add_product_to_selling_list",
-        "description": "Adds a new product to the farmer's selling list with product name, unit price, and unit type (kg, mon, quintal, ton).",
-        "parameters": {
+        },
+        method="GET",
+        endpoint="/api/prices/public",
+        timeout=4,
+        retry=RetryPolicy(attempts=2, backoff=0.2, hedge_after=BACKEND_HEDGE_DELAY),
+        cache=CachePolicy(ttl=MARKET_PRICES_CACHE_TTL, stale_ttl=MARKET_PRICES_STALE_TTL),
+        result_shape=ResultShape(drop_keys=RECORD_METADATA_KEYS, max_list_items=60),
+    ),
+    ToolDefinition(
+        name="add_product_to_selling_list",
+        description="Adds a new product to the farmer's selling list with product name, unit price, and unit type (kg, mon, quintal, ton).",
+        parameters={
             "type": "object",
             "properties": {
                 "phone_number": {
@@ -94,13 +307,18 @@ TOOLS = [
                 }
             },
             "required": ["phone_number", "product_name", "unit_price", "unit"]
-        }
-    },
-    {
-        "type": "function",
-        "name": "delete_product_from_selling_list",
-        "description": "Removes a product from the farmer's selling list using the product ID.",
-        "parameters": {
+        },
+        method="POST",
+        endpoint="/api/voice/add-product-by-phone",
+        timeout=8,
+        success_message="Product added successfully",
+        invalidates=("get_farmer_data",),
+        deduplicate=True,
+    ),
+    ToolDefinition(
+        name="delete_product_from_selling_list",
+        description="Removes a product from the farmer's selling list using the product ID.",
+        parameters={
             "type": "object",
             "properties": {
                 "phone_number": {
@@ -113,108 +331,1821 @@ TOOLS = [
                 }
             },
             "required": ["phone_number", "product_id"]
-        }
-    }
-]
+        },
+        method="POST",
+        endpoint="/api/voice/delete-product-by-phone",
+        timeout=8,
+        success_message="Product deleted successfully",
+        invalidates=("get_farmer_data",),
+        deduplicate=True,
+    ),
+)}
+TOOLS = [tool.schema() for tool in TOOL_REGISTRY.values()]
+# OpenAI events kept in call captures: turn-taking, transcripts, tool calls and errors
+CAPTURE_EVENT_TYPES = {
+    'input_audio_buffer.speech_started', 'input_audio_buffer.speech_stopped',
+    'conversation.item.input_audio_transcription.completed', 'response.output_audio_transcript.done',
+    'response.function_call_arguments.done', 'error',
+}
 LOG_EVENT_TYPES = [
     'error', 'response.content.done', 'rate_limits.updated',
     'response.done', 'input_audio_buffer.committed',
     'input_audio_buffer.speech_stopped', 'input_audio_buffer.speech_started',
     'session.created', 'session.updated', 'response.function_call_arguments.done'
 ]
-SHOW_TIMING_MATH = False
 
-app = FastAPI()
+if orjson is not None:
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+else:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+class CallLogContext:
+    """Identifiers attached to every log record emitted while handling one call."""
+    __slots__ = ("stream_sid", "call_sid")
+
+    def __init__(self):
+        self.stream_sid = "-"
+        self.call_sid = "-"
+
+
+# Holds a mutable context object so that the relay tasks of a call, which each run in their own
+# copy of the context, all see the stream and call SIDs once Twilio's start event sets them.
+call_log_context: ContextVar[Optional[CallLogContext]] = ContextVar("call_log_context", default=None)
+
+
+class CallContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = call_log_context.get()
+        record.stream_sid = context.stream_sid if context else "-"
+        record.call_sid = context.call_sid if context else "-"
+        return True
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line, including the call identifiers and any structured fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            "stream_sid": record.stream_sid,
+            "call_sid": record.call_sid,
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json_dumps(entry)
+
+
+class TextLogFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Queue handler that never blocks the event loop: records are dropped when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(value: str) -> dict[str, float]:
+    """Parse "event.type=rate,other.type=rate" into a mapping of sample rates."""
+    rates = {}
+    for item in value.split(","):
+        event_type, _, rate = item.partition("=")
+        if event_type.strip() and rate.strip():
+            rates[event_type.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+LOG_SAMPLE_RATES = parse_sample_rates(LOG_SAMPLE_RATES_SETTING)
+
+
+def configure_logging() -> DroppingQueueHandler:
+    """Route the "voice" logger through a bounded queue to a background writer thread."""
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonLogFormatter())
+    else:
+        stream_handler.setFormatter(TextLogFormatter("%(asctime)s %(levelname)s [%(stream_sid)s] %(message)s"))
+
+    handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(CallContextFilter())
+    listener = QueueListener(handler.queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(handler)
+    logger.propagate = False
+    return handler
+
+
+def truncate_for_log(value, limit: int = None) -> str:
+    """Serialize a payload for logging, cutting it to LOG_MAX_PAYLOAD_CHARS."""
+    limit = LOG_MAX_PAYLOAD_CHARS if limit is None else limit
+    text = value if isinstance(value, str) else json_dumps(value)
+    if limit and len(text) > limit:
+        return f"{text[:limit]}…(+{len(text) - limit} chars)"
+    return text
+
+
+def log_event(level: int, event_type: str, message: str, payload=None):
+    """Log an event subject to the level, its sample rate and payload truncation.
+
+    The level and sampling checks run first, so skipped events cost no serialization.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = LOG_SAMPLE_RATES.get(event_type, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        return
+    fields = {"event": event_type}
+    if payload is not None:
+        fields["payload"] = truncate_for_log(payload)
+    logger.log(level, message, extra={"fields": fields})
+
+
+logger = logging.getLogger("voice")
+log_handler = configure_logging()
+
+
+# Pre-serialized envelopes for the audio relay hot path. Base64 payloads never need JSON escaping,
+# so frames are spliced into these templates instead of being parsed and re-serialized.
+TWILIO_MEDIA_PREFIX = '{"event":"media","streamSid":'
+TWILIO_MEDIA_PAYLOAD = ',"media":{"payload":"'
+TWILIO_MEDIA_SUFFIX = '"}}'
+OPENAI_AUDIO_APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+OPENAI_AUDIO_APPEND_SUFFIX = '"}'
+
+
+def build_twilio_media_message(stream_sid_json: str, payload: str) -> str:
+    """Wrap a base64 audio payload in a Twilio media message for an already JSON-encoded streamSid."""
+    return TWILIO_MEDIA_PREFIX + stream_sid_json + TWILIO_MEDIA_PAYLOAD + payload + TWILIO_MEDIA_SUFFIX
+
+
+def build_openai_audio_append(payload: str) -> str:
+    """Wrap a base64 audio payload in an input_audio_buffer.append event."""
+    return OPENAI_AUDIO_APPEND_PREFIX + payload + OPENAI_AUDIO_APPEND_SUFFIX
+
+
+def extract_twilio_media(message: str) -> Optional[tuple[int, str]]:
+    """Return (timestamp, payload) of a Twilio media message without a full JSON parse.
+
+    Returns None for any other event, or if the message is not laid out the way Twilio sends it,
+    in which case the caller falls back to parsing it.
+    """
+    if not message.startswith('{"event":"media"'):
+        return None
+    timestamp_start = message.find('"timestamp":"')
+    payload_start = message.find('"payload":"')
+    if timestamp_start < 0 or payload_start < 0:
+        return None
+    timestamp_start += 13
+    payload_start += 11
+    timestamp_end = message.find('"', timestamp_start)
+    payload_end = message.find('"', payload_start)
+    if timestamp_end < 0 or payload_end < 0:
+        return None
+    try:
+        return int(message[timestamp_start:timestamp_end]), message[payload_start:payload_end]
+    except ValueError:
+        return None
+
+
+# G.711 μ-law at 8 kHz is one byte per sample
+MULAW_BYTES_PER_MS = 8
+
+
+def base64_decoded_length(payload: str) -> int:
+    """Return the number of bytes a base64 string decodes to, without decoding it."""
+    return len(payload) * 3 // 4 - payload[-2:].count('=')
+
+
+def linear16_to_mulaw(pcm: bytes) -> bytes:
+    """Encode little-endian 16-bit PCM samples as G.711 μ-law."""
+    encoded = bytearray(len(pcm) // 2)
+    for index in range(len(encoded)):
+        value = int.from_bytes(pcm[2 * index:2 * index + 2], 'little', signed=True) >> 2
+        if value < 0:
+            value, mask = -value, 0x7F
+        else:
+            mask = 0xFF
+        value = min(value, 8158) + 0x21
+        segment = max(value.bit_length() - 6, 0)
+        encoded[index] = ((segment << 4) | ((value >> (segment + 1)) & 0x0F)) ^ mask
+    return bytes(encoded)
+
+
+def load_mulaw_audio(path: str) -> bytes:
+    """Load an 8 kHz mono clip as raw μ-law bytes.
+
+    Accepts WAV files encoded as μ-law or 16-bit PCM, and headerless raw μ-law files.
+    """
+    with open(path, 'rb') as audio_file:
+        data = audio_file.read()
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        return data
+
+    audio_format = channels = sample_rate = bits_per_sample = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = int.from_bytes(data[offset + 4:offset + 8], 'little')
+        chunk = data[offset + 8:offset + 8 + chunk_size]
+        if chunk_id == b'fmt ':
+            audio_format = int.from_bytes(chunk[0:2], 'little')
+            channels = int.from_bytes(chunk[2:4], 'little')
+            sample_rate = int.from_bytes(chunk[4:8], 'little')
+            bits_per_sample = int.from_bytes(chunk[14:16], 'little')
+        elif chunk_id == b'data':
+            if channels != 1 or sample_rate != 8000:
+                raise ValueError(f"{path}: expected 8 kHz mono audio, got {channels} channel(s) at {sample_rate} Hz")
+            if audio_format == 7:
+                return chunk
+            if audio_format == 1 and bits_per_sample == 16:
+                return linear16_to_mulaw(chunk)
+            raise ValueError(f"{path}: unsupported WAV encoding (format {audio_format}, {bits_per_sample} bits)")
+        offset += 8 + chunk_size + (chunk_size & 1)
+    raise ValueError(f"{path}: no data chunk found")
+
+
+def mulaw_wav(audio: bytes) -> bytes:
+    """Wrap 8 kHz mono μ-law audio in a WAV container, as read back by load_mulaw_audio()."""
+    fmt = (
+        (7).to_bytes(2, 'little') + (1).to_bytes(2, 'little') + (8000).to_bytes(4, 'little')
+        + (8000).to_bytes(4, 'little') + (1).to_bytes(2, 'little') + (8).to_bytes(2, 'little')
+        + (0).to_bytes(2, 'little')
+    )
+    chunks = (
+        b'fmt ' + len(fmt).to_bytes(4, 'little') + fmt
+        + b'fact' + (4).to_bytes(4, 'little') + len(audio).to_bytes(4, 'little')
+        + b'data' + len(audio).to_bytes(4, 'little') + audio + b'\0' * (len(audio) & 1)
+    )
+    return b'RIFF' + (4 + len(chunks)).to_bytes(4, 'little') + b'WAVE' + chunks
+
+
+def split_mulaw_frames(audio: bytes, frame_ms: int) -> list[str]:
+    """Split μ-law audio into base64 payloads of frame_ms each, ready to send to Twilio."""
+    frame_bytes = frame_ms * MULAW_BYTES_PER_MS
+    return [
+        base64.b64encode(audio[start:start + frame_bytes]).decode()
+        for start in range(0, len(audio), frame_bytes)
+    ]
+
+
+# Pre-encoded greeting for GREETING_MODE=stream, loaded once at startup
+greeting_frames: list[str] = []
+
+
+def load_greeting_audio():
+    """Load the streamed greeting into memory, falling back to <Say> if it cannot be read."""
+    global GREETING_MODE
+    if GREETING_MODE == 'play' and not os.path.isfile(GREETING_AUDIO_FILE):
+        logger.warning("⚠️  Greeting audio %s not found, falling back to <Say> greeting", GREETING_AUDIO_FILE)
+        GREETING_MODE = 'say'
+    elif GREETING_MODE == 'stream' and not greeting_frames:
+        try:
+            greeting_frames.extend(split_mulaw_frames(load_mulaw_audio(GREETING_AUDIO_FILE), 1000))
+        except (OSError, ValueError) as e:
+            logger.warning("⚠️  Could not load greeting audio (%s), falling back to <Say> greeting", e)
+            GREETING_MODE = 'say'
+
+
+FILLER_FRAME_MS = 20
+# Each clip is a list of base64 20 ms frames, ready to be spliced into Twilio media messages
+filler_clips: list[list[str]] = []
+
+
+def load_filler_audio():
+    """Load the filler clips into memory; without any, tool calls simply run in silence."""
+    if filler_clips or not os.path.isdir(FILLER_AUDIO_DIR):
+        return
+    for name in sorted(os.listdir(FILLER_AUDIO_DIR)):
+        if not name.lower().endswith(('.wav', '.ulaw', '.raw')):
+            continue
+        try:
+            frames = split_mulaw_frames(load_mulaw_audio(os.path.join(FILLER_AUDIO_DIR, name)), FILLER_FRAME_MS)
+        except (OSError, ValueError) as e:
+            logger.warning("⚠️  Could not load filler audio %s (%s), skipping it", name, e)
+            continue
+        if frames:
+            filler_clips.append(frames)
+    logger.info("Loaded %d filler clip(s) from %s", len(filler_clips), FILLER_AUDIO_DIR)
+
+
+MULAW_SILENCE = b'\xff'
+
+
+def render_capture_track(frames, base_ms: int) -> bytes:
+    """Lay captured (stream ms, base64 payload) frames out on the call's timeline as raw μ-law.
+
+    Gaps are filled with silence, and a frame sent while earlier audio is still playing follows it
+    back to back, as Twilio plays it. A None payload marks a clear, which cuts everything that had
+    not been played by then.
+    """
+    audio = bytearray()
+    for stream_ms, payload in frames:
+        start = max(0, stream_ms - base_ms) * MULAW_BYTES_PER_MS
+        if payload is None:
+            del audio[start:]
+            continue
+        if len(audio) < start:
+            audio += MULAW_SILENCE * (start - len(audio))
+        audio += base64.b64decode(payload)
+    return bytes(audio)
+
+
+def _mulaw_magnitude(byte: int) -> int:
+    """Return the absolute 16-bit linear amplitude of a μ-law byte, divided by 128 to fit in a byte."""
+    byte = ~byte & 0xFF
+    exponent = (byte >> 4) & 0x07
+    magnitude = (((byte & 0x0F) << 3) + 0x84) << exponent
+    return (magnitude - 0x84) >> 7
+
+
+# bytes.translate table mapping each μ-law byte to its scaled magnitude, so a frame's energy is
+# computed in C as sum(frame.translate(MULAW_MAGNITUDE_TABLE))
+MULAW_MAGNITUDE_TABLE = bytes(_mulaw_magnitude(byte) for byte in range(256))
+
+
+class SilenceGate:
+    """Drops clearly silent inbound frames while keeping the padding server_vad needs.
+
+    The last SILENCE_PREROLL_MS of silence is held back and sent just before speech, and
+    SILENCE_HANGOVER_MS of silence is still forwarded after speech so the end of turn is detected.
+    """
+
+    __slots__ = ("threshold", "preroll_bytes", "hangover_bytes", "_preroll", "_preroll_size",
+                 "_hangover_left", "frames_dropped", "bytes_dropped")
+
+    def __init__(self, threshold: int = SILENCE_THRESHOLD, preroll_ms: int = SILENCE_PREROLL_MS,
+                 hangover_ms: int = SILENCE_HANGOVER_MS):
+        # Compare sums of scaled magnitudes against threshold * frame length without dividing
+        self.threshold = threshold / 128
+        self.preroll_bytes = preroll_ms * MULAW_BYTES_PER_MS
+        self.hangover_bytes = hangover_ms * MULAW_BYTES_PER_MS
+        self._preroll: deque = deque()
+        self._preroll_size = 0
+        self._hangover_left = 0
+        self.frames_dropped = 0
+        self.bytes_dropped = 0
+
+    def is_voiced(self, audio: bytes) -> bool:
+        return sum(audio.translate(MULAW_MAGNITUDE_TABLE)) >= self.threshold * len(audio)
+
+    def process(self, payload: str) -> list[str]:
+        """Return the payloads to forward for this frame (possibly including held-back preroll)."""
+        audio = base64.b64decode(payload)
+        if self.is_voiced(audio):
+            self._hangover_left = self.hangover_bytes
+            if not self._preroll:
+                return [payload]
+            forwarded = [preroll_payload for preroll_payload, _ in self._preroll]
+            forwarded.append(payload)
+            self._preroll.clear()
+            self._preroll_size = 0
+            return forwarded
+
+        if self._hangover_left > 0:
+            self._hangover_left -= len(audio)
+            return [payload]
+
+        self._preroll.append((payload, len(audio)))
+        self._preroll_size += len(audio)
+        while self._preroll_size > self.preroll_bytes and self._preroll:
+            _, dropped_size = self._preroll.popleft()
+            self._preroll_size -= dropped_size
+            self.frames_dropped += 1
+            self.bytes_dropped += dropped_size
+        return []
+
+    def stats(self) -> dict:
+        return {"frames_dropped": self.frames_dropped, "bytes_dropped": self.bytes_dropped}
+
+
+class OutboundAudioPacketizer:
+    """Coalesces small OpenAI audio deltas into larger Twilio media frames.
+
+    Deltas that are already at least the target size are passed through without being decoded.
+    """
+
+    def __init__(self, frame_ms: int = OUTBOUND_FRAME_MS):
+        self.target_bytes = frame_ms * MULAW_BYTES_PER_MS
+        self._buffer = bytearray()
+
+    def push(self, delta: str) -> Optional[str]:
+        """Add a delta and return a base64 frame once enough audio has been buffered."""
+        if not self.target_bytes or (not self._buffer and base64_decoded_length(delta) >= self.target_bytes):
+            return delta
+        self._buffer += base64.b64decode(delta)
+        if len(self._buffer) < self.target_bytes:
+            return None
+        return self.flush()
+
+    def flush(self) -> Optional[str]:
+        """Return whatever audio is buffered as a base64 frame."""
+        if not self._buffer:
+            return None
+        payload = base64.b64encode(self._buffer).decode()
+        self._buffer.clear()
+        return payload
+
+    def clear(self):
+        self._buffer.clear()
+
+
+class SlowConsumerError(Exception):
+    """A relay queue overflowed while RELAY_SLOW_CONSUMER is "hangup"."""
+
+
+# Relay queue counters over all calls, by direction, for /metrics
+relay_queue_totals = {
+    direction: {"overflows": 0, "dropped": 0, "cleared": 0} for direction in ("inbound", "outbound")
+}
+
+
+class RelayQueue:
+    """Bounded FIFO between a socket reader and the writer task that owns the other socket.
+
+    Putting never waits, so a stalled socket cannot hold up the reader (and with it interruption
+    handling). When the queue is full, RELAY_SLOW_CONSUMER decides between dropping the oldest frame
+    and ending the call.
+    """
+
+    def __init__(self, direction: str, max_items: int):
+        self.direction = direction
+        self.max_items = max(1, max_items)
+        self._items: deque = deque()
+        self._ready = asyncio.Event()
+        self._totals = relay_queue_totals[direction]
+        # Bumped by clear(), so the writer can tell that an item it already took was cancelled
+        self.generation = 0
+        self.max_depth = 0
+        self.overflows = 0
+        self.dropped = 0
+        self.cleared = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def peek(self):
+        return self._items[0] if self._items else None
+
+    def put(self, item):
+        if len(self._items) >= self.max_items:
+            self.overflows += 1
+            self._totals["overflows"] += 1
+            if RELAY_SLOW_CONSUMER == 'hangup':
+                raise SlowConsumerError(f"{self.direction} relay queue full ({self.max_items} frames)")
+            self._items.popleft()
+            self.dropped += 1
+            self._totals["dropped"] += 1
+        self._items.append(item)
+        self.max_depth = max(self.max_depth, len(self._items))
+        self._ready.set()
+
+    async def get(self):
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popleft()
+
+    def clear(self) -> int:
+        """Discard everything queued and return how many items that was."""
+        cleared = len(self._items)
+        self._items.clear()
+        self.generation += 1
+        self.cleared += cleared
+        self._totals["cleared"] += cleared
+        return cleared
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self._items),
+            "max_depth": self.max_depth,
+            "overflows": self.overflows,
+            "dropped": self.dropped,
+            "cleared": self.cleared,
+        }
+
+
+# Latency buckets in seconds, from sub-millisecond relay work up to slow backend calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Per-frame relay work is measured in microseconds
+RELAY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+
+def _escape_label_value(value) -> str:
+    """Escape a label value as the Prometheus text format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    """Minimal Prometheus-style histogram with optional labels."""
+
+    __slots__ = ("name", "help_text", "buckets", "_series")
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+def render_metric(name: str, metric_type: str, help_text: str, samples) -> list[str]:
+    """Render a gauge or counter from (labels dict, value) pairs, or a single value."""
+    if not isinstance(samples, list):
+        samples = [({}, samples)]
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {value}")
+    return lines
+
+
+TIME_TO_FIRST_AUDIO = Histogram(
+    "voice_time_to_first_audio_seconds",
+    "Time from the caller's speech_stopped to the first response audio frame sent to Twilio.",
+)
+OPENAI_FIRST_DELTA = Histogram(
+    "voice_openai_first_delta_seconds",
+    "Time from input_audio_buffer.committed to the first response.output_audio.delta from OpenAI.",
+)
+TOOL_LATENCY = Histogram("voice_tool_latency_seconds", "Tool call duration as seen by the call, including cache hits.")
+BACKEND_LATENCY = Histogram("voice_backend_request_seconds", "AgriSense backend request duration per tool.")
+RELAY_FRAME_OVERHEAD = Histogram(
+    "voice_relay_frame_seconds", "Server time spent relaying one audio frame, per direction.", RELAY_BUCKETS
+)
+TOOL_OUTPUT_SIZE = Histogram(
+    "voice_tool_output_chars", "Size of the function_call_output sent to the model, per tool.",
+    (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000),
+)
+EVENT_LOOP_LAG = Histogram("voice_event_loop_lag_seconds", "How late the event loop woke up a periodic timer.")
+EVENT_LOOP_LAG_INTERVAL = 0.25
+event_loop_lag_seconds = 0.0
+
+
+async def monitor_event_loop_lag():
+    """Measure how late the loop runs a timer; sustained lag means frames are being delayed."""
+    global event_loop_lag_seconds
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        event_loop_lag_seconds = max(time.perf_counter() - started - EVENT_LOOP_LAG_INTERVAL, 0.0)
+        EVENT_LOOP_LAG.observe(event_loop_lag_seconds)
+
+
+class SharedHttpClient:
+    """App-lifetime, connection-pooled aiohttp session shared by all tools."""
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.requests_started = 0
+        self.requests_in_flight = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.requests_started += 1
+            self.requests_in_flight += 1
+
+        async def on_request_done(session, ctx, params):
+            self.requests_in_flight -= 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.connections_created += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.connections_reused += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_done)
+        trace_config.on_request_exception.append(on_request_done)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            use_dns_cache=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            trace_configs=[self._build_trace_config()],
+        )
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it if the lifespan hook has not run."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    def stats(self) -> dict:
+        total_connections = self.connections_created + self.connections_reused
+        return {
+            "requests_started": self.requests_started,
+            "requests_in_flight": self.requests_in_flight,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "reuse_rate": round(self.connections_reused / total_connections, 3) if total_connections else 0.0,
+            "limit": HTTP_POOL_LIMIT,
+            "limit_per_host": HTTP_POOL_LIMIT_PER_HOST,
+        }
+
+
+http_client = SharedHttpClient()
+
+
+async def connect_openai_realtime(initialize: bool = True):
+    """Open a Realtime API connection and, unless told not to, send the base session configuration.
+
+    Connections opened for a call that has just started skip the base configuration: the call
+    sends its whole session, instructions included, in one session.update once Twilio's start
+    event says who is calling and why.
+    """
+    openai_ws = await websockets.connect(
+        f"{OPENAI_REALTIME_URL}?model=gpt-realtime&temperature={TEMPERATURE}",
+        additional_headers={
+            "Authorization": f"Bearer {OPENAI_API_KEY}"
+        }
+    )
+    if not initialize:
+        return openai_ws
+    try:
+        await initialize_session(openai_ws)
+    except Exception:
+        await openai_ws.close()
+        raise
+    return openai_ws
+
+
+class RealtimeConnectionPool:
+    """Keeps initialized Realtime sessions open so calls skip the TLS, WebSocket and session.update setup."""
+
+    def __init__(self, size: int = OPENAI_POOL_SIZE, idle_ttl: float = OPENAI_POOL_IDLE_TTL,
+                 health_interval: float = OPENAI_POOL_HEALTH_INTERVAL):
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self.health_interval = health_interval
+        # (opened_at, connection), oldest first
+        self._idle: deque = deque()
+        self._refill = asyncio.Event()
+        self._maintainer: Optional[asyncio.Task] = None
+        self.warm_claims = 0
+        self.cold_claims = 0
+        self.opened = 0
+        self.discarded = 0
+        self.open_failures = 0
+
+    async def start(self):
+        if self.size > 0 and self._maintainer is None:
+            self._maintainer = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            self._maintainer = None
+        while self._idle:
+            _, openai_ws = self._idle.popleft()
+            await openai_ws.close()
+
+    def _is_usable(self, opened_at: float, openai_ws) -> bool:
+        return openai_ws.state.name == 'OPEN' and time.monotonic() - opened_at < self.idle_ttl
+
+    async def acquire(self) -> tuple:
+        """Return a Realtime connection and whether its session is already initialized.
+
+        Pooled connections are; a new one opened because none is pooled is left for the call to
+        initialize.
+        """
+        while self._idle:
+            opened_at, openai_ws = self._idle.pop()
+            if self._is_usable(opened_at, openai_ws):
+                self.warm_claims += 1
+                self._refill.set()
+                return openai_ws, True
+            self.discarded += 1
+            await openai_ws.close()
+        self.cold_claims += 1
+        self._refill.set()
+        return await connect_openai_realtime(initialize=False), False
+
+    async def _check_health(self):
+        """Close pooled connections that expired or stopped answering pings."""
+        for entry in list(self._idle):
+            opened_at, openai_ws = entry
+            healthy = self._is_usable(opened_at, openai_ws)
+            if healthy:
+                try:
+                    pong_waiter = await openai_ws.ping()
+                    await asyncio.wait_for(pong_waiter, timeout=5)
+                except Exception:
+                    healthy = False
+            if not healthy and entry in self._idle:
+                self._idle.remove(entry)
+                self.discarded += 1
+                await openai_ws.close()
+
+    async def _maintain(self):
+        backoff = 1.0
+        while True:
+            await self._check_health()
+            while len(self._idle) < self.size:
+                try:
+                    openai_ws = await connect_openai_realtime()
+                except Exception as e:
+                    self.open_failures += 1
+                    logger.warning("Failed to pre-open Realtime connection: %s", e)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    break
+                backoff = 1.0
+                self.opened += 1
+                self._idle.append((time.monotonic(), openai_ws))
+            self._refill.clear()
+            try:
+                await asyncio.wait_for(self._refill.wait(), timeout=self.health_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "warm_claims": self.warm_claims,
+            "cold_claims": self.cold_claims,
+            "opened": self.opened,
+            "discarded": self.discarded,
+            "open_failures": self.open_failures,
+        }
+
+
+realtime_pool = RealtimeConnectionPool()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown."""
+    await http_client.start()
+    await realtime_pool.start()
+    load_greeting_audio()
+    load_filler_audio()
+    call_lifecycle.install_signal_handler()
+    lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+    load_reporter = asyncio.create_task(call_admission.report_periodically())
+    # Warm the market price cache so the first caller does not wait on the backend
+    warmup_task = asyncio.create_task(execute_tool("get_market_prices", {}))
+    try:
+        yield
+    finally:
+        warmup_task.cancel()
+        lag_monitor.cancel()
+        load_reporter.cancel()
+        await backend_keep_warm.close()
+        for campaign in outbound_campaigns.values():
+            campaign.cancel()
+        # Calls still connected (e.g. after Ctrl+C) are ended before the resources they use are closed
+        await call_lifecycle.close_sessions("server shutting down")
+        await call_capture_writer.close()
+        await realtime_pool.close()
+        await close_twilio_client()
+        await http_client.close()
+        shared_store.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Pydantic model for outbound call request
 class OutboundCallRequest(BaseModel):
     phone_number: str
     reason: Optional[str] = None
 
+class CampaignRequest(BaseModel):
+    calls: list[OutboundCallRequest] = Field(min_length=1)
+    # Used for entries that do not set their own reason
+    reason: Optional[str] = None
+    # Unset means CAMPAIGN_CALLS_PER_SECOND / CAMPAIGN_MAX_CONCURRENT_CALLS; other values must be positive
+    calls_per_second: Optional[float] = Field(None, gt=0)
+    max_concurrent_calls: Optional[int] = Field(None, ge=1)
+
 if not OPENAI_API_KEY:
     raise ValueError('Missing the OpenAI API key. Please set it in the .env file.')
 
-# Tool execution function
-async def execute_tool(function_name: str, arguments: dict):
-    """Execute the requested tool/function and return the result."""
-    print(f"Executing tool: {function_name} with arguments: {arguments}")
-    
-    if function_name == "get_farmer_data":
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://agrisense-z6ks.onrender.com/api/voice/get-farmer-data",
-                    json=arguments,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return {"success": True, "data": data}
-                    else:
-                        error_text = await response.text()
-                        return {"success": False, "error": f"API returned status {response.status}: {error_text}"}
-        except asyncio.TimeoutError:
-            return {"success": False, "error": "Request timed out"}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    elif function_name == "get_market_prices":
+class CallCapture:
+    """What one call sounded like and what happened in it, held in memory until the call ends.
+
+    The relay only appends references to payload strings it already has; decoding and file
+    writes happen later, in CallCaptureWriter's thread.
+    """
+
+    __slots__ = ("started_at", "started_wall", "stream_sid", "call_sid", "inbound", "outbound", "events")
+
+    def __init__(self, max_seconds: int = CAPTURE_MAX_SECONDS, max_events: int = CAPTURE_MAX_EVENTS):
+        self.started_at = time.monotonic()
+        self.started_wall = time.time()
+        self.stream_sid: Optional[str] = None
+        self.call_sid: Optional[str] = None
+        # Ring buffers of (Twilio stream timestamp in ms, base64 μ-law payload); 20 ms frames at most
+        self.inbound: deque = deque(maxlen=max_seconds * 50)
+        self.outbound: deque = deque(maxlen=max_seconds * 50)
+        self.events: deque = deque(maxlen=max_events)
+
+    def add_event(self, stream_ms: int, event_type: str, fields: dict):
+        self.events.append({"t": round(time.monotonic() - self.started_at, 3), "ms": stream_ms, "type": event_type, **fields})
+
+    def name(self) -> str:
+        started = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime(self.started_wall))
+        return f"{started}-{self.call_sid or self.stream_sid or uuid.uuid4().hex[:12]}"
+
+    def files(self, audio_format: str) -> dict[str, bytes]:
+        """Render the capture: caller and assistant audio on a shared timeline, and the event log."""
+        starts = [frames[0][0] for frames in (self.inbound, self.outbound) if frames]
+        base_ms = min(starts) if starts else 0
+        extension, encode = ('wav', mulaw_wav) if audio_format == 'wav' else ('ulaw', bytes)
+        return {
+            f"caller.{extension}": encode(render_capture_track(self.inbound, base_ms)),
+            f"assistant.{extension}": encode(render_capture_track(self.outbound, base_ms)),
+            "events.jsonl": "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in self.events).encode(),
+        }
+
+
+class CallCaptureWriter:
+    """Writes finished call captures to disk from a background task, batching calls that end together."""
+
+    # Calls ending within this many seconds of each other are written in one trip to the writer thread
+    BATCH_DELAY = 1.0
+
+    def __init__(self, directory: str = CAPTURE_DIR, audio_format: str = CAPTURE_AUDIO_FORMAT,
+                 retention_mb: int = CAPTURE_RETENTION_MB):
+        self.directory = directory
+        self.audio_format = audio_format
+        self.retention_bytes = retention_mb * 2**20
+        self._pending: list[CallCapture] = []
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failures = 0
+        self.bytes_written = 0
+        self.deleted = 0
+
+    def submit(self, capture: CallCapture):
+        self._pending.append(capture)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.BATCH_DELAY)
+            await self._flush()
+
+    async def _flush(self):
+        batch, self._pending = self._pending, []
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    "https://agrisense-z6ks.onrender.com/api/prices/public",
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return {"success": True, "data": data}
-                    else:
-                        error_text = await response.text()
-                        return {"success": False, "error": f"API returned status {response.status}: {error_text}"}
-        except asyncio.TimeoutError:
-            return {"success": False, "error": "Request timed out"}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    elif function_name == "add_product_to_selling_list":
+            bytes_written, deleted = await asyncio.to_thread(self._write_batch, batch)
+        except OSError as e:
+            self.failures += len(batch)
+            logger.warning("⚠️  Could not write %d call capture(s) to %s: %s", len(batch), self.directory, e)
+            return
+        self.written += len(batch)
+        self.bytes_written += bytes_written
+        self.deleted += deleted
+
+    def _write_batch(self, batch: list[CallCapture]) -> tuple[int, int]:
+        bytes_written = 0
+        for capture in batch:
+            path = os.path.join(self.directory, capture.name())
+            os.makedirs(path, exist_ok=True)
+            for name, data in capture.files(self.audio_format).items():
+                with open(os.path.join(path, name), 'wb') as capture_file:
+                    capture_file.write(data)
+                bytes_written += len(data)
+        return bytes_written, self._enforce_retention()
+
+    def _enforce_retention(self) -> int:
+        """Delete the oldest captures until the directory is back under the retention cap."""
+        captures = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if os.path.isdir(path):
+                captures.append((path, sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())))
+        total = sum(size for _, size in captures)
+        deleted = 0
+        # Names start with the call's UTC start time, so sorted order is oldest first
+        for path, size in captures:
+            if total <= self.retention_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            deleted += 1
+        return deleted
+
+    async def close(self):
+        """Write whatever is still pending; called on shutdown after the last calls have ended."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        if self._pending:
+            await self._flush()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": CALL_CAPTURE,
+            "directory": self.directory,
+            "pending": len(self._pending),
+            "written": self.written,
+            "failures": self.failures,
+            "bytes_written": self.bytes_written,
+            "deleted": self.deleted,
+        }
+
+
+call_capture_writer = CallCaptureWriter()
+
+
+def summarize_cache_entries(entries, now: float) -> dict[str, dict]:
+    """Count cached entries per tool from (key, fetched_at) pairs.
+
+    Keys contain callers' phone numbers, so only per-tool counts and ages are reported.
+    """
+    summary: dict[str, dict] = {}
+    for key, fetched_at in entries:
+        age = round(now - fetched_at, 1)
+        tool = summary.setdefault(key.partition(":")[0], {"entries": 0, "oldest_age_seconds": age, "newest_age_seconds": age})
+        tool["entries"] += 1
+        tool["oldest_age_seconds"] = max(tool["oldest_age_seconds"], age)
+        tool["newest_age_seconds"] = min(tool["newest_age_seconds"], age)
+    return summary
+
+
+class MemoryStore:
+    """Process-local shared state; the default when a single worker runs.
+
+    Entries are kept in the order they were fetched, so the oldest are evicted first once they
+    pass the retention period or the store is over its entry cap.
+    """
+
+    def __init__(self, retention: float = TOOL_CACHE_RETENTION, max_entries: int = TOOL_CACHE_MAX_ENTRIES):
+        self.retention = retention
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.evictions = 0
+        self._pending_admissions: dict[str, float] = {}
+
+    def get(self, key: str) -> Optional[tuple[float, dict]]:
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry[0] > self.retention:
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        return entry
+
+    def set(self, key: str, fetched_at: float, value: dict):
+        self._entries[key] = (fetched_at, value)
+        self._entries.move_to_end(key)
+        expired_before = time.time() - self.retention
+        while self._entries:
+            oldest_key, (oldest_fetched_at, _) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_entries and oldest_fetched_at >= expired_before:
+                break
+            del self._entries[oldest_key]
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def entry_summary(self) -> dict[str, dict]:
+        return summarize_cache_entries(((key, fetched_at) for key, (fetched_at, _) in self._entries.items()), time.time())
+
+    def report_call_load(self, worker_id: str, calls: int):
+        pass
+
+    def other_workers_call_load(self, worker_id: str) -> int:
+        return 0
+
+    def add_pending_admission(self, admission_id: str, expires_at: float):
+        self._pending_admissions[admission_id] = expires_at
+
+    def remove_pending_admission(self, admission_id: str):
+        self._pending_admissions.pop(admission_id, None)
+
+    def pending_admissions(self) -> int:
+        now = time.time()
+        for admission_id in [key for key, expires_at in self._pending_admissions.items() if expires_at <= now]:
+            del self._pending_admissions[admission_id]
+        return len(self._pending_admissions)
+
+    def close(self):
+        pass
+
+
+class SqliteStore:
+    """State shared by every worker on a host through one SQLite file in WAL mode.
+
+    Reads and writes are local and usually sub-millisecond, so they run inline on the event loop.
+    While another worker holds the write lock a statement waits at most busy_timeout, so the
+    relay is never stalled for long. A lock timeout or any other SQLite error is logged and treated
+    as a cache miss rather than failing the call.
+    """
+
+    busy_timeout = 0.05
+
+    # Cached responses older than this are deleted; last_known() answers come from within it
+    retention = TOOL_CACHE_RETENTION
+    max_entries = TOOL_CACHE_MAX_ENTRIES
+    # Other workers' call counts older than this are ignored (the worker is presumed gone)
+    load_report_ttl = 30
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tool_cache (key TEXT PRIMARY KEY, fetched_at REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS call_load (worker TEXT PRIMARY KEY, calls INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending_admissions (id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self._writes = 0
+        self.errors = 0
+
+    def _execute(self, sql: str, parameters=()) -> list:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://agrisense-z6ks.onrender.com/api/voice/add-product-by-phone",
-                    json=arguments,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return {"success": True, "data": data, "message": "Product added successfully"}
-                    else:
-                        error_text = await response.text()
-                        return {"success": False, "error": f"API returned status {response.status}: {error_text}"}
-        except asyncio.TimeoutError:
-            return {"success": False, "error": "Request timed out"}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    elif function_name == "delete_product_from_selling_list":
+            return self._conn.execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Shared store error: %s", e)
+            return []
+
+    def get(self, key: str) -> Optional[tuple[float, dict]]:
+        rows = self._execute(
+            "SELECT fetched_at, value FROM tool_cache WHERE key = ? AND fetched_at >= ?", (key, time.time() - self.retention)
+        )
+        return (rows[0][0], json_loads(rows[0][1])) if rows else None
+
+    def set(self, key: str, fetched_at: float, value: dict):
+        self._execute("INSERT OR REPLACE INTO tool_cache VALUES (?, ?, ?)", (key, fetched_at, json_dumps(value)))
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self._execute("DELETE FROM tool_cache WHERE fetched_at < ?", (time.time() - self.retention,))
+            self._execute(
+                "DELETE FROM tool_cache WHERE key IN (SELECT key FROM tool_cache ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str):
+        self._execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+
+    def entry_summary(self) -> dict[str, dict]:
+        return summarize_cache_entries(self._execute("SELECT key, fetched_at FROM tool_cache"), time.time())
+
+    def report_call_load(self, worker_id: str, calls: int):
+        self._execute("INSERT OR REPLACE INTO call_load VALUES (?, ?, ?)", (worker_id, calls, time.time()))
+
+    def other_workers_call_load(self, worker_id: str) -> int:
+        rows = self._execute(
+            "SELECT COALESCE(SUM(calls), 0) FROM call_load WHERE worker != ? AND updated_at > ?",
+            (worker_id, time.time() - self.load_report_ttl),
+        )
+        return rows[0][0] if rows else 0
+
+    def add_pending_admission(self, admission_id: str, expires_at: float):
+        self._execute("DELETE FROM pending_admissions WHERE expires_at <= ?", (time.time(),))
+        self._execute("INSERT OR REPLACE INTO pending_admissions VALUES (?, ?)", (admission_id, expires_at))
+
+    def remove_pending_admission(self, admission_id: str):
+        self._execute("DELETE FROM pending_admissions WHERE id = ?", (admission_id,))
+
+    def pending_admissions(self) -> int:
+        rows = self._execute("SELECT COUNT(*) FROM pending_admissions WHERE expires_at > ?", (time.time(),))
+        return rows[0][0] if rows else 0
+
+    def close(self):
+        self._execute("DELETE FROM call_load WHERE worker = ?", (WORKER_ID,))
+        self._conn.close()
+
+
+def create_shared_store():
+    """Build the store named by SHARED_STORE: "memory", "sqlite" or "package.module:factory".
+
+    A custom factory (for example one returning a Redis-backed store) is called with no arguments
+    and must return an object with the same methods as MemoryStore.
+    """
+    if SHARED_STORE == "memory":
+        return MemoryStore()
+    if SHARED_STORE == "sqlite":
+        return SqliteStore(SHARED_STORE_PATH)
+    module_name, _, factory_name = SHARED_STORE.partition(":")
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+
+shared_store = create_shared_store()
+
+
+class ToolResponseCache:
+    """TTL cache with stale-while-revalidate over a shared store, with per-process single-flight fetches."""
+
+    def __init__(self, store):
+        self.store = store
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    @staticmethod
+    def make_key(tool_name: str, arguments: dict) -> str:
+        return f"{tool_name}:{json.dumps(arguments, sort_keys=True)}"
+
+    async def get_or_fetch(self, key: str, policy: CachePolicy, fetch) -> dict:
+        """Return a cached result, serving stale values while a background refresh runs."""
+        entry = self.store.get(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age < policy.ttl:
+                self.hits += 1
+                return entry[1]
+            if age < policy.ttl + policy.stale_ttl:
+                self.stale_hits += 1
+                self._start_fetch(key, fetch)
+                return entry[1]
+        self.misses += 1
+        return await asyncio.shield(self._start_fetch(key, fetch))
+
+    def _start_fetch(self, key: str, fetch) -> asyncio.Task:
+        """Start an upstream fetch for key unless one is already in flight."""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key, fetch))
+            self._inflight[key] = task
+            task.add_done_callback(self._fetch_done)
+        return task
+
+    def _fetch_done(self, task: asyncio.Task):
+        for key, inflight in list(self._inflight.items()):
+            if inflight is task:
+                del self._inflight[key]
+
+    async def _load(self, key: str, fetch) -> dict:
+        self.refreshes += 1
+        task = asyncio.current_task()
+        result = await fetch()
+        if not result.get("success"):
+            self.refresh_failures += 1
+        elif self._inflight.get(key) is task:
+            # Not stored if the key was invalidated meanwhile: the response may predate the write
+            self.store.set(key, time.time(), result)
+        return result
+
+    def last_known(self, key: str) -> Optional[tuple[float, dict]]:
+        """Return the age and value of the last successful response for key, however old."""
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+        return time.time() - entry[0], entry[1]
+
+    def invalidate(self, key: str):
+        self.store.delete(key)
+        # Reads after this start a fresh fetch rather than joining one that may predate the write
+        self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "refreshes_in_flight": len(self._inflight),
+            "store": type(self.store).__name__,
+            "entries": self.store.entry_summary(),
+        }
+
+
+tool_response_cache = ToolResponseCache(shared_store)
+
+
+class CircuitBreaker:
+    """Per-endpoint circuit breaker.
+
+    After BACKEND_BREAKER_FAILURES consecutive failures (timeouts, connection errors, 5xx) the
+    breaker opens and requests fail immediately. After BACKEND_BREAKER_RESET seconds one probe
+    request is let through; its outcome closes the breaker or opens it again.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name: str, failure_threshold: int = BACKEND_BREAKER_FAILURES,
+                 reset_timeout: float = BACKEND_BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.opens = 0
+        self.rejections = 0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        self.rejections += 1
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opens += 1
+                logger.warning("⚠️  Circuit for %s opened after %d failures", self.name, self.consecutive_failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opens": self.opens,
+            "rejections": self.rejections,
+        }
+
+
+circuit_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(tool: ToolDefinition) -> CircuitBreaker:
+    breaker = circuit_breakers.get(tool.endpoint)
+    if breaker is None:
+        breaker = circuit_breakers[tool.endpoint] = CircuitBreaker(tool.endpoint)
+    return breaker
+
+
+BACKEND_UNAVAILABLE_ERROR = (
+    "The AgriSense service is temporarily unavailable. Tell the farmer you cannot reach their "
+    "records right now and offer general advice or to call back later."
+)
+hedged_requests = 0
+
+
+async def _request_tool_once(session: aiohttp.ClientSession, tool: ToolDefinition, request_kwargs: dict) -> tuple[dict, bool]:
+    """Send one request for a tool; return its result and whether the failure is worth retrying."""
+    breaker = get_circuit_breaker(tool)
+    request_started = time.perf_counter()
+    try:
+        async with session.request(tool.method, tool.url, **request_kwargs) as response:
+            if response.status == 200:
+                try:
+                    data = await response.json()
+                except (aiohttp.ContentTypeError, ValueError) as e:
+                    # e.g. an HTML holding page while the host wakes up: not a usable answer
+                    breaker.record_failure()
+                    return {"success": False, "error": f"API returned an unreadable response: {e}"}, True
+                BACKEND_LATENCY.observe(time.perf_counter() - request_started, tool=tool.name)
+                breaker.record_success()
+                result = {"success": True, "data": data}
+                if tool.success_message:
+                    result["message"] = tool.success_message
+                return result, False
+            error_text = await response.text()
+            result = {"success": False, "error": f"API returned status {response.status}: {error_text}"}
+            if response.status < 500:
+                # The backend answered; a client error says nothing about its health
+                breaker.record_success()
+                return result, False
+            breaker.record_failure()
+            return result, True
+    except asyncio.TimeoutError:
+        breaker.record_failure()
+        return {"success": False, "error": "Request timed out"}, True
+    except aiohttp.ClientConnectionError as e:
+        breaker.record_failure()
+        return {"success": False, "error": str(e)}, True
+    except Exception as e:
+        return {"success": False, "error": str(e)}, False
+    finally:
+        # Whatever happened, including a losing hedge being cancelled, a half-open probe slot is
+        # released; otherwise the breaker would refuse every later request to this endpoint
+        breaker.probe_in_flight = False
+
+
+async def _request_tool_hedged(session: aiohttp.ClientSession, tool: ToolDefinition, request_kwargs: dict) -> tuple[dict, bool]:
+    """Send a second, concurrent request if the first is slower than hedge_after; first answer wins."""
+    global hedged_requests
+    primary = asyncio.create_task(_request_tool_once(session, tool, request_kwargs))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=tool.retry.hedge_after)
+        if done or not get_circuit_breaker(tool).allow():
+            return await primary
+        hedged_requests += 1
+        pending.add(asyncio.create_task(_request_tool_once(session, tool, request_kwargs)))
+        outcome = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                outcome = task.result()
+                if not outcome[1]:
+                    return outcome
+        return outcome
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_http_tool(tool: ToolDefinition, arguments: dict, idempotency_key: Optional[str] = None) -> dict:
+    """Call the tool's HTTP backend, honouring its timeout and retry policy.
+
+    An idempotency key is sent unchanged with every attempt, so the backend can apply a write once.
+    """
+    session = await http_client.get_session()
+    request_kwargs = {"timeout": aiohttp.ClientTimeout(total=tool.timeout, connect=HTTP_CONNECT_TIMEOUT)}
+    if idempotency_key:
+        request_kwargs["headers"] = {"Idempotency-Key": idempotency_key}
+    if tool.method == "GET":
+        if arguments:
+            request_kwargs["params"] = arguments
+    else:
+        request_kwargs["json"] = arguments
+
+    breaker = get_circuit_breaker(tool)
+    result = {"success": False, "error": "Request was not attempted"}
+    for attempt in range(1, max(tool.retry.attempts, 1) + 1):
+        if attempt > 1 and tool.retry.backoff:
+            await asyncio.sleep(tool.retry.backoff * (attempt - 1))
+        if not breaker.allow():
+            return {"success": False, "degraded": True, "error": BACKEND_UNAVAILABLE_ERROR}
+        if tool.retry.hedge_after > 0:
+            result, retryable = await _request_tool_hedged(session, tool, request_kwargs)
+        else:
+            result, retryable = await _request_tool_once(session, tool, request_kwargs)
+        if not retryable:
+            return result
+    return result
+
+
+class BackendKeepWarm:
+    """Pings the AgriSense backend while calls are active so a sleeping host is woken early."""
+
+    def __init__(self, interval: float = BACKEND_KEEPWARM_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.pings = 0
+        self.ping_failures = 0
+        self.last_ping_seconds: Optional[float] = None
+
+    def ensure_running(self):
+        """Ping now and keep pinging until no calls are active; called when a call arrives."""
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self.ping()
+            await asyncio.sleep(self.interval)
+            if not active_call_sessions:
+                return
+
+    async def ping(self):
+        self.pings += 1
+        started = time.perf_counter()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    "https://agrisense-z6ks.onrender.com/api/voice/delete-product-by-phone",
-                    json=arguments,
-                    timeout=aiohttp.ClientTimeout(total=10)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return {"success": True, "data": data, "message": "Product deleted successfully"}
-                    else:
-                        error_text = await response.text()
-                        return {"success": False, "error": f"API returned status {response.status}: {error_text}"}
-        except asyncio.TimeoutError:
-            return {"success": False, "error": "Request timed out"}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
-    
-    return {"success": False, "error": f"Unknown function: {function_name}"}
+            session = await http_client.get_session()
+            timeout = aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+            async with session.get(f"{AGRISENSE_BASE_URL}{BACKEND_KEEPWARM_PATH}", timeout=timeout) as response:
+                await response.read()
+                if response.status >= 500:
+                    self.ping_failures += 1
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            self.ping_failures += 1
+            logger.warning("Backend keep-warm ping failed: %s", e)
+        self.last_ping_seconds = round(time.perf_counter() - started, 3)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "pings": self.pings,
+            "ping_failures": self.ping_failures,
+            "last_ping_seconds": self.last_ping_seconds,
+        }
+
+
+backend_keep_warm = BackendKeepWarm()
+
+
+def normalize_phone_number(phone_number: str) -> str:
+    """Normalize a phone number to international format so cache keys match across sources."""
+    normalized = "".join(ch for ch in (phone_number or "").strip() if ch.isdigit() or ch == "+")
+    if normalized.startswith("00"):
+        normalized = "+" + normalized[2:]
+    elif normalized.startswith("880"):
+        normalized = "+" + normalized
+    return normalized
+
+
+def normalize_write_arguments(value):
+    """Canonical form of tool arguments for spotting repeats: case, spacing and 5 vs 5.0 do not matter."""
+    if isinstance(value, dict):
+        return {key: normalize_write_arguments(item) for key, item in value.items() if item not in (None, "")}
+    if isinstance(value, list):
+        return [normalize_write_arguments(item) for item in value]
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if _is_number(value):
+        return float(value)
+    return value
+
+
+@dataclass
+class WriteRecord:
+    idempotency_key: str
+    # The call and farmer the write belongs to; any successful write in this scope supersedes the others
+    scope: str
+    task: Optional[asyncio.Task] = None
+    expires_at: float = 0.0
+
+
+class WriteDeduplicator:
+    """Runs a write tool once per call for the same farmer and arguments.
+
+    The Realtime model sometimes repeats a function call after an interruption. A repeat that
+    arrives while the first is running waits for it, and one that arrives within the window
+    afterwards gets its result. A failed write is tried again when repeated, under the same
+    idempotency key, because a request that timed out may still have reached the backend.
+    Once any write for a farmer succeeds, earlier writes for that farmer no longer count as done:
+    after an add and a delete, adding the same product again is a new write.
+    """
+
+    def __init__(self, window: float = WRITE_DEDUP_WINDOW):
+        self.window = window
+        self._records: dict[str, WriteRecord] = {}
+        self.executed = 0
+        self.coalesced = 0
+        self.replayed = 0
+
+    @staticmethod
+    def make_scope(arguments: dict) -> str:
+        context = call_log_context.get()
+        call = "-"
+        if context is not None:
+            call = context.call_sid if context.call_sid != "-" else context.stream_sid
+        return f"{call}:{arguments.get('phone_number') or '-'}"
+
+    @staticmethod
+    def make_key(scope: str, tool_name: str, arguments: dict) -> str:
+        return f"{scope}:{tool_name}:{json.dumps(normalize_write_arguments(arguments), sort_keys=True)}"
+
+    async def _write(self, key: str, record: WriteRecord, tool: ToolDefinition, arguments: dict) -> dict:
+        result = await perform_tool_call(tool, arguments, record.idempotency_key)
+        if result.get("success"):
+            for other_key in [other_key for other_key, other in self._records.items()
+                              if other.scope == record.scope and other_key != key]:
+                del self._records[other_key]
+        return result
+
+    async def run(self, tool: ToolDefinition, arguments: dict) -> dict:
+        now = time.monotonic()
+        for key in [key for key, record in self._records.items() if record.expires_at < now and record.task.done()]:
+            del self._records[key]
+
+        scope = self.make_scope(arguments)
+        key = self.make_key(scope, tool.name, arguments)
+        record = self._records.get(key)
+        if record is None:
+            record = self._records[key] = WriteRecord(uuid.uuid4().hex, scope)
+        task = record.task
+        duplicate = task is not None
+        if task is None or (task.done() and (task.cancelled() or task.exception() or not task.result().get("success"))):
+            self.executed += 1
+            duplicate = False
+            task = record.task = asyncio.create_task(self._write(key, record, tool, arguments))
+        elif task.done():
+            self.replayed += 1
+        else:
+            self.coalesced += 1
+        record.expires_at = now + self.window
+        # Shielded so a caller hanging up mid-write does not cancel the request others are waiting for
+        result = await asyncio.shield(task)
+        if duplicate and result.get("success"):
+            return {**result, "duplicate": True, "message": "Already done earlier in this call; nothing was changed again."}
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "window_seconds": self.window,
+            "tracked": len(self._records),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+        }
+
+
+write_deduplicator = WriteDeduplicator()
+
+
+# Keys that mark a list of objects as timestamped readings rather than a plain table
+TIMESTAMP_KEYS = ("timestamp", "time", "date", "datetime", "dt", "recorded_at", "recordedAt")
+
+
+def compact_json(obj) -> str:
+    """Serialize without whitespace and without escaping Bangla text, which would triple its size."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def summarize_series(values: list, digits: int) -> dict:
+    """Reduce a numeric series to its latest value, range, mean and direction."""
+    low, high = min(values), max(values)
+    change = values[-1] - values[0]
+    if high == low or abs(change) < 0.1 * (high - low):
+        trend = "steady"
+    else:
+        trend = "rising" if change > 0 else "falling"
+    return {
+        "latest": round(values[-1], digits),
+        "min": round(low, digits),
+        "max": round(high, digits),
+        "avg": round(sum(values) / len(values), digits),
+        "trend": trend,
+    }
+
+
+def _summarize_readings(items: list[dict], time_key: str, shape: ResultShape) -> dict:
+    try:
+        items = sorted(items, key=lambda item: item[time_key])
+    except TypeError:
+        pass
+    numeric_keys = [
+        key for key in items[-1]
+        if key != time_key and all(_is_number(item.get(key)) for item in items)
+    ]
+    summary = {"readings": len(items), "from": items[0][time_key], "to": items[-1][time_key]}
+    for key in numeric_keys:
+        summary[key] = summarize_series([item[key] for item in items], shape.round_digits)
+    return summary
+
+
+def shape_value(value, shape: ResultShape, max_items: int, max_chars: int):
+    """Recursively compact a tool response: drop keys, round numbers, summarize series, cap lists."""
+    if isinstance(value, dict):
+        return {
+            key: shape_value(item, shape, max_items, max_chars)
+            for key, item in value.items()
+            if key not in shape.drop_keys and item is not None
+        }
+    if isinstance(value, float):
+        return round(value, shape.round_digits)
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars] + "…"
+    if not isinstance(value, list):
+        return value
+
+    if len(value) >= shape.series_min_length and all(_is_number(item) for item in value):
+        return summarize_series(value, shape.round_digits)
+    if value and all(isinstance(item, dict) for item in value):
+        time_key = next((key for key in TIMESTAMP_KEYS if all(key in item for item in value)), None)
+        if time_key and len(value) >= shape.series_min_length:
+            return _summarize_readings(value, time_key, shape)
+        if len(value) >= shape.table_min_rows:
+            # Repeating every key in every row is most of the size of a uniform list of objects
+            rows = [shape_value(item, shape, max_items, max_chars) for item in value[:max_items]]
+            columns = list(dict.fromkeys(key for row in rows for key in row))
+            table = {"columns": columns, "rows": [[row.get(column) for column in columns] for row in rows]}
+            if len(value) > max_items:
+                table["omitted_rows"] = len(value) - max_items
+            return table
+    shaped = [shape_value(item, shape, max_items, max_chars) for item in value[:max_items]]
+    if len(value) > max_items:
+        shaped.append(f"… {len(value) - max_items} more")
+    return shaped
+
+
+def shape_tool_result(tool: Optional[ToolDefinition], result: dict) -> str:
+    """Return the function_call_output text for a tool result, compacted to TOOL_RESULT_MAX_CHARS."""
+    if not TOOL_RESULT_SHAPING or tool is None or not result.get("success") or "data" not in result:
+        return json.dumps(result)
+
+    shape = tool.result_shape
+    max_items, max_chars = shape.max_list_items, shape.max_string_chars
+    while True:
+        text = compact_json({**result, "data": shape_value(result["data"], shape, max_items, max_chars)})
+        if len(text) <= TOOL_RESULT_MAX_CHARS or (max_items == 1 and max_chars == 40):
+            break
+        # Over budget: keep fewer list items and shorter strings until it fits
+        max_items, max_chars = max(1, max_items // 2), max(40, max_chars // 2)
+    if len(text) > TOOL_RESULT_MAX_CHARS:
+        text = compact_json({"success": True, "truncated": True, "data_preview": text[:TOOL_RESULT_MAX_CHARS - 60]})
+    return text
+
+
+# Tool execution function
+async def execute_tool(function_name: str, arguments: dict):
+    """Execute the requested tool/function and return the result."""
+    log_event(logging.INFO, "tool.start", f"Executing tool: {function_name}", arguments)
+
+    tool = TOOL_REGISTRY.get(function_name)
+    if tool is None:
+        return {"success": False, "error": f"Unknown function: {function_name}"}
+
+    if arguments.get("phone_number"):
+        arguments = {**arguments, "phone_number": normalize_phone_number(str(arguments["phone_number"]))}
+
+    if tool.cache and tool.cache.ttl > 0:
+        key = ToolResponseCache.make_key(tool.name, arguments)
+        result = await tool_response_cache.get_or_fetch(key, tool.cache, lambda: call_http_tool(tool, arguments))
+        if not result.get("success"):
+            # Better an old answer than dead air while the backend is down
+            fallback = tool_response_cache.last_known(key)
+            if fallback is not None:
+                age, cached = fallback
+                return {
+                    **cached,
+                    "stale": True,
+                    "message": f"AgriSense is unavailable right now; this data is from {int(age // 60)} minutes ago.",
+                }
+        return result
+
+    if tool.deduplicate and write_deduplicator.window > 0:
+        return await write_deduplicator.run(tool, arguments)
+    return await perform_tool_call(tool, arguments, uuid.uuid4().hex if tool.deduplicate else None)
+
+
+async def perform_tool_call(tool: ToolDefinition, arguments: dict, idempotency_key: Optional[str] = None) -> dict:
+    """Call an uncached tool, then drop cached reads for the farmer that it may have changed."""
+    result = await call_http_tool(tool, arguments, idempotency_key)
+    if result.get("success") and arguments.get("phone_number"):
+        for cached_tool_name in tool.invalidates:
+            tool_response_cache.invalidate(
+                ToolResponseCache.make_key(cached_tool_name, {"phone_number": arguments["phone_number"]})
+            )
+    return result
+
+def phone_number_instructions(phone_number: str) -> str:
+    return (
+        f"\n\nThe farmer's phone number is {phone_number}. "
+        "Use it whenever a tool needs a phone number."
+    )
+
+
+def call_reason_instructions(call_reason: str) -> str:
+    return (
+        f"\n\nThe farmer is being contacted for the following reason: {call_reason}. "
+        "Begin by greeting them warmly in Bangla and clearly stating this reason before offering additional help."
+    )
+
+
+def build_call_instructions(call_reason: Optional[str] = None, phone_number: Optional[str] = None) -> str:
+    """Return the session instructions for a call, including its reason and the caller's number."""
+    instructions = SYSTEM_MESSAGE
+    if phone_number:
+        instructions += phone_number_instructions(phone_number)
+    if call_reason:
+        instructions += call_reason_instructions(call_reason)
+    return instructions
+
+
+def json_string_body(text: str) -> str:
+    """JSON-encode a string without its surrounding quotes, so encoded pieces can be concatenated."""
+    return json.dumps(text)[1:-1]
+
+
+# The session configuration is the same for every call apart from the instructions, and most of
+# those are SYSTEM_MESSAGE, so both are serialized once here and each call's session.update is
+# assembled by splicing in the JSON-encoded parts that differ.
+SESSION_CONFIG = {
+    "type": "realtime",
+    "model": "gpt-realtime",
+    "output_modalities": ["audio"],
+    "audio": {
+        "input": {
+            "format": {"type": "audio/pcmu"},
+            "turn_detection": {"type": "server_vad"},
+            **({"transcription": {"model": INPUT_TRANSCRIPTION_MODEL}} if INPUT_TRANSCRIPTION_MODEL else {})
+        },
+        "output": {
+            "format": {"type": "audio/pcmu"},
+            "voice": VOICE
+        }
+    },
+    "tools": TOOLS,
+    "tool_choice": "auto"
+}
+SESSION_UPDATE_PREFIX = json.dumps({"type": "session.update", "session": SESSION_CONFIG})[:-2] + ', "instructions": "'
+INSTRUCTIONS_UPDATE_PREFIX = '{"type": "session.update", "session": {"instructions": "'
+SESSION_UPDATE_SUFFIX = '"}}'
+SYSTEM_MESSAGE_JSON = json_string_body(SYSTEM_MESSAGE)
+
+
+@lru_cache(maxsize=CALL_REASON_CACHE_SIZE)
+def call_reason_instructions_json(call_reason: str) -> str:
+    """Outbound campaigns reuse a handful of reasons, so their encoded instructions are kept."""
+    return json_string_body(call_reason_instructions(call_reason))
+
+
+def build_session_update(call_reason: Optional[str] = None, phone_number: Optional[str] = None,
+                         instructions_only: bool = False) -> str:
+    """Return a serialized session.update carrying build_call_instructions(call_reason, phone_number).
+
+    With instructions_only the rest of the session is left out, for connections that were
+    initialized before the call started.
+    """
+    parts = [INSTRUCTIONS_UPDATE_PREFIX if instructions_only else SESSION_UPDATE_PREFIX, SYSTEM_MESSAGE_JSON]
+    if phone_number:
+        parts.append(json_string_body(phone_number_instructions(phone_number)))
+    if call_reason:
+        parts.append(call_reason_instructions_json(call_reason))
+    parts.append(SESSION_UPDATE_SUFFIX)
+    return "".join(parts)
+
+
+BASE_SESSION_UPDATE = build_session_update()
 
 def get_public_hostname(request: Request) -> tuple[str, int | None]:
     """Get the public hostname from request, checking headers for reverse proxy."""
@@ -243,13 +2174,296 @@ def get_public_hostname(request: Request) -> tuple[str, int | None]:
     # Priority 4: Fallback to request.url
     return request.url.hostname, request.url.port
 
+def get_public_base_url(request: Request) -> str:
+    """Return the http(s) base URL Twilio should use to reach this server."""
+    host, port = get_public_hostname(request)
+
+    # Determine scheme (use https for public URLs, http for localhost)
+    if PUBLIC_URL:
+        scheme = "https" if PUBLIC_URL.startswith("https") else "http"
+    else:
+        scheme = request.url.scheme
+
+    if port and port not in [80, 443]:
+        base_url = f"{scheme}://{host}:{port}"
+    else:
+        base_url = f"{scheme}://{host}"
+
+    # Warn if using localhost/internal IP (Twilio can't reach it)
+    if host in ['localhost', '127.0.0.1'] or (host and (host.startswith('192.168.') or host.startswith('10.'))):
+        logger.warning(
+            "⚠️  WARNING: Using %s for Twilio callback. This may fail for outbound calls! "
+            "Set PUBLIC_URL in .env to your public URL (e.g., https://your-domain.com or ngrok URL)", base_url
+        )
+    return base_url
+
+def build_call_url(base_url: str, reason: Optional[str]) -> str:
+    """Return the /incoming-call URL Twilio fetches once an outbound call is answered."""
+    call_url = f"{base_url}/incoming-call"
+    sanitized_reason = (reason or "").strip()
+    if sanitized_reason:
+        call_url = f"{call_url}?{urlencode({'reason': sanitized_reason[:250]})}"
+    return call_url
+
+
+_twilio_client: Optional[Client] = None
+
+
+def get_twilio_client() -> Client:
+    """Return the shared Twilio client, whose requests run on the event loop via aiohttp."""
+    global _twilio_client
+    if _twilio_client is None:
+        _twilio_client = Client(
+            TWILIO_ACCOUNT_SID,
+            TWILIO_AUTH_TOKEN,
+            http_client=AsyncTwilioHttpClient(timeout=HTTP_TOTAL_TIMEOUT),
+        )
+    return _twilio_client
+
+
+async def close_twilio_client():
+    global _twilio_client
+    if _twilio_client is not None:
+        await _twilio_client.http_client.close()
+        _twilio_client = None
+
+
+async def place_outbound_call(phone_number: str, call_url: str, status_callback: Optional[str] = None):
+    """Ask Twilio to dial phone_number without blocking the event loop."""
+    create_kwargs = {"to": phone_number, "from_": TWILIO_PHONE_NUMBER, "url": call_url}
+    if status_callback:
+        create_kwargs["status_callback"] = status_callback
+    return await get_twilio_client().calls.create_async(**create_kwargs)
+
+
+class OutboundCampaign:
+    """Dials a list of farmers at a bounded rate with a cap on simultaneous live calls."""
+
+    # Twilio call statuses after which the call no longer occupies a line
+    TERMINAL_STATUSES = {"completed", "busy", "failed", "no-answer", "canceled"}
+
+    def __init__(self, campaign_request: CampaignRequest, base_url: str):
+        self.campaign_id = uuid.uuid4().hex
+        self.base_url = base_url
+        self.calls_per_second = campaign_request.calls_per_second
+        if self.calls_per_second is None:
+            self.calls_per_second = CAMPAIGN_CALLS_PER_SECOND
+        self.max_concurrent_calls = campaign_request.max_concurrent_calls
+        if self.max_concurrent_calls is None:
+            self.max_concurrent_calls = CAMPAIGN_MAX_CONCURRENT_CALLS
+        self.results = [
+            {
+                "phone_number": call.phone_number,
+                "reason": call.reason or campaign_request.reason,
+                "status": "pending",
+                "call_sid": None,
+                "error": None,
+            }
+            for call in campaign_request.calls
+        ]
+        self._slots = asyncio.Semaphore(self.max_concurrent_calls)
+        self._call_finished = [asyncio.Event() for _ in self.results]
+        self._tasks: set[asyncio.Task] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.created_at = time.time()
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        interval = 1 / self.calls_per_second if self.calls_per_second > 0 else 0
+        next_dial_at = time.monotonic()
+        for index, result in enumerate(self.results):
+            await self._slots.acquire()
+            delay = next_dial_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_dial_at = time.monotonic() + interval
+
+            status_callback = f"{self.base_url}/campaign-call-status?{urlencode({'campaign_id': self.campaign_id, 'index': index})}"
+            try:
+                call = await place_outbound_call(
+                    result["phone_number"], build_call_url(self.base_url, result["reason"]), status_callback
+                )
+            except Exception as e:
+                result.update(status="failed", error=str(e))
+                self._slots.release()
+                continue
+            result.update(status="initiated", call_sid=call.sid)
+            task = asyncio.create_task(self._hold_slot(index))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _hold_slot(self, index: int):
+        """Keep a concurrency slot until Twilio reports the call finished (or it times out)."""
+        try:
+            await asyncio.wait_for(self._call_finished[index].wait(), timeout=CAMPAIGN_CALL_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._slots.release()
+
+    def update_call_status(self, index: int, call_status: str):
+        if not 0 <= index < len(self.results):
+            return
+        self.results[index]["status"] = call_status
+        if call_status in self.TERMINAL_STATUSES:
+            self._call_finished[index].set()
+
+    def cancel(self):
+        if self.task is not None:
+            self.task.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+
+    def summary(self) -> dict:
+        counts: dict[str, int] = {}
+        for result in self.results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        return {
+            "campaign_id": self.campaign_id,
+            "total": len(self.results),
+            "status_counts": counts,
+            "finished_dialling": self.task is not None and self.task.done(),
+            "calls_per_second": self.calls_per_second,
+            "max_concurrent_calls": self.max_concurrent_calls,
+        }
+
+
+# Campaigns started in this process, most recent last
+outbound_campaigns: dict[str, OutboundCampaign] = {}
+MAX_TRACKED_CAMPAIGNS = 50
+
 @app.get("/", response_class=JSONResponse)
 async def index_page():
     return {"message": "Twilio Media Stream Server is running!"}
 
+@app.get("/health")
+async def health_check():
+    """Readiness probe: 503 once the server is draining, so load balancers stop sending it calls."""
+    if call_lifecycle.draining:
+        return JSONResponse(status_code=503, content={"status": "draining"})
+    return JSONResponse(content={"status": "ok"})
+
+@app.get("/stats", response_class=JSONResponse)
+async def stats_page():
+    """Expose runtime statistics for monitoring."""
+    return {
+        "http_pool": http_client.stats(),
+        "realtime_pool": realtime_pool.stats(),
+        "tool_cache": tool_response_cache.stats(),
+        "write_dedup": write_deduplicator.stats(),
+        "admission": call_admission.stats(),
+        "lifecycle": call_lifecycle.stats(),
+        "call_reason_cache": call_reason_instructions_json.cache_info()._asdict(),
+        "capture": call_capture_writer.stats(),
+        "relay_queues": relay_queue_totals,
+        "backend": {
+            "circuit_breakers": {name: breaker.stats() for name, breaker in circuit_breakers.items()},
+            "hedged_requests": hedged_requests,
+            "keep_warm": backend_keep_warm.stats(),
+        },
+        "calls": [session.stats() for session in active_call_sessions],
+    }
+
+@app.get("/metrics")
+async def metrics_page():
+    """Expose metrics in the Prometheus text format."""
+    http_stats = http_client.stats()
+    cache_stats = tool_response_cache.stats()
+    pool_stats = realtime_pool.stats()
+    sessions = list(active_call_sessions)
+    lines = []
+    lines += render_metric("voice_active_calls", "gauge", "Media streams currently connected.", len(sessions))
+    lines += render_metric(
+        "voice_call_captures_total", "counter", "Call captures flushed to disk by result.",
+        [({"result": "written"}, call_capture_writer.written), ({"result": "failed"}, call_capture_writer.failures)],
+    )
+    lines += render_metric("voice_draining", "gauge", "1 while the server is draining calls before shutdown.", int(call_lifecycle.draining))
+    lines += render_metric(
+        "voice_admission_total", "counter", "Calls reaching /incoming-call by admission result.",
+        [({"result": "admitted"}, call_admission.admitted), ({"result": "queued"}, call_admission.queued),
+         ({"result": "rejected"}, call_admission.rejected)],
+    )
+    lines += render_metric(
+        "voice_twilio_marks_outstanding", "gauge",
+        "Audio chunks sent to Twilio and not yet played, summed over calls.",
+        sum(session.marks_outstanding for session in sessions),
+    )
+    lines += render_metric(
+        "voice_relay_queue_depth", "gauge", "Frames waiting in relay queues, summed over calls.",
+        [({"direction": "inbound"}, sum(len(session.inbound_queue) for session in sessions)),
+         ({"direction": "outbound"}, sum(len(session.outbound_queue) for session in sessions))],
+    )
+    lines += render_metric(
+        "voice_relay_queue_overflows_total", "counter", "Frames put on a full relay queue.",
+        [({"direction": direction}, totals["overflows"]) for direction, totals in relay_queue_totals.items()],
+    )
+    lines += render_metric(
+        "voice_relay_queue_dropped_frames_total", "counter",
+        "Queued frames discarded, because the queue overflowed or an interruption cleared it.",
+        [({"direction": direction, "reason": reason}, totals[key])
+         for direction, totals in relay_queue_totals.items()
+         for reason, key in (("overflow", "dropped"), ("cleared", "cleared"))],
+    )
+    lines += render_metric(
+        "voice_openai_send_buffer_bytes", "gauge",
+        "Bytes queued in the OpenAI WebSocket transports, summed over calls.",
+        sum(session.openai_send_buffer_size() for session in sessions),
+    )
+    lines += render_metric(
+        "voice_tool_calls_in_flight", "gauge", "Tool calls currently running.",
+        sum(len(session.tool_tasks) for session in sessions),
+    )
+    lines += render_metric("voice_event_loop_lag_current_seconds", "gauge", "Most recent event loop lag sample.", event_loop_lag_seconds)
+    lines += render_metric("voice_http_requests_in_flight", "gauge", "Backend HTTP requests in flight.", http_stats["requests_in_flight"])
+    lines += render_metric(
+        "voice_http_connections_total", "counter", "Backend HTTP connections by whether they were reused.",
+        [({"kind": "created"}, http_stats["connections_created"]), ({"kind": "reused"}, http_stats["connections_reused"])],
+    )
+    lines += render_metric(
+        "voice_tool_cache_lookups_total", "counter", "Tool cache lookups by result.",
+        [({"result": "hit"}, cache_stats["hits"]), ({"result": "stale"}, cache_stats["stale_hits"]),
+         ({"result": "miss"}, cache_stats["misses"])],
+    )
+    lines += render_metric(
+        "voice_tool_writes_total", "counter", "Write tool calls by whether they reached the backend or reused a repeat's result.",
+        [({"result": "executed"}, write_deduplicator.executed), ({"result": "coalesced"}, write_deduplicator.coalesced),
+         ({"result": "replayed"}, write_deduplicator.replayed)],
+    )
+    lines += render_metric("voice_realtime_pool_idle", "gauge", "Pre-initialized Realtime connections ready.", pool_stats["idle"])
+    lines += render_metric(
+        "voice_realtime_pool_claims_total", "counter", "Realtime connections claimed by calls.",
+        [({"kind": "warm"}, pool_stats["warm_claims"]), ({"kind": "cold"}, pool_stats["cold_claims"])],
+    )
+    breakers = list(circuit_breakers.values())
+    lines += render_metric(
+        "voice_backend_circuit_open", "gauge", "Whether each backend endpoint's circuit breaker is open (1), half open (0.5) or closed (0).",
+        [({"endpoint": b.name}, {CircuitBreaker.OPEN: 1, CircuitBreaker.HALF_OPEN: 0.5}.get(b.state, 0)) for b in breakers],
+    )
+    lines += render_metric(
+        "voice_backend_circuit_opens_total", "counter", "Times each endpoint's circuit breaker opened.",
+        [({"endpoint": b.name}, b.opens) for b in breakers],
+    )
+    lines += render_metric(
+        "voice_backend_circuit_rejections_total", "counter", "Requests failed fast because the circuit was open.",
+        [({"endpoint": b.name}, b.rejections) for b in breakers],
+    )
+    lines += render_metric("voice_backend_hedged_requests_total", "counter", "Hedged duplicate backend reads sent.", hedged_requests)
+    lines += render_metric(
+        "voice_backend_keepwarm_pings_total", "counter", "Backend keep-warm pings by result.",
+        [({"result": "ok"}, backend_keep_warm.pings - backend_keep_warm.ping_failures),
+         ({"result": "failed"}, backend_keep_warm.ping_failures)],
+    )
+    for histogram in (TIME_TO_FIRST_AUDIO, OPENAI_FIRST_DELTA, TOOL_LATENCY, BACKEND_LATENCY, RELAY_FRAME_OVERHEAD, TOOL_OUTPUT_SIZE, EVENT_LOOP_LAG):
+        lines += histogram.render()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 @app.post("/make-call")
 async def make_outbound_call(request: Request, call_request: OutboundCallRequest):
     """Initiate an outbound call to the specified phone number."""
+    if call_lifecycle.draining:
+        return JSONResponse(status_code=503, content={"success": False, "error": "Server is shutting down"})
     try:
         # Validate Twilio credentials
         if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER]):
@@ -260,51 +2474,16 @@ async def make_outbound_call(request: Request, call_request: OutboundCallRequest
                     "error": "Twilio credentials not configured. Please set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, and TWILIO_PHONE_NUMBER in .env file."
                 }
             )
-        
-        # Initialize Twilio client
-        client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-        
-        # Get the public hostname (same logic as incoming-call)
-        host, port = get_public_hostname(request)
-        
-        # Determine scheme (use https for public URLs, http for localhost)
-        if PUBLIC_URL:
-            scheme = "https" if PUBLIC_URL.startswith("https") else "http"
-        else:
-            scheme = request.url.scheme
-        
-        # Build the base URL
-        if port and port not in [80, 443]:
-            base_url = f"{scheme}://{host}:{port}"
-        else:
-            base_url = f"{scheme}://{host}"
-        
+
+        # Get the public base URL (same logic as incoming-call)
+        base_url = get_public_base_url(request)
+
         # Log for debugging
-        print(f"📞 Making outbound call to {call_request.phone_number}")
-        print(f"   Callback URL will be: {base_url}/incoming-call")
-        
-        # Warn if using localhost/internal IP (Twilio can't reach it)
-        if host in ['localhost', '127.0.0.1'] or (host and (host.startswith('192.168.') or host.startswith('10.'))):
-            print(f"⚠️  WARNING: Using {base_url} for Twilio callback. This may fail for outbound calls!")
-            print("   Set PUBLIC_URL in .env to your public URL (e.g., https://your-domain.com or ngrok URL)")
-        
-        query_params = {}
-        if call_request.reason:
-            sanitized_reason = call_request.reason.strip()
-            if sanitized_reason:
-                query_params["reason"] = sanitized_reason[:250]
-
-        call_url = f"{base_url}/incoming-call"
-        if query_params:
-            call_url = f"{call_url}?{urlencode(query_params)}"
-
-        # Make the outbound call
-        call = client.calls.create(
-            to=call_request.phone_number,
-            from_=TWILIO_PHONE_NUMBER,
-            url=call_url
-        )
-        
+        logger.info("📞 Making outbound call to %s (callback URL %s/incoming-call)", call_request.phone_number, base_url)
+
+        # Make the outbound call without blocking live media streams
+        call = await place_outbound_call(call_request.phone_number, build_call_url(base_url, call_request.reason))
+
         return JSONResponse(
             content={
                 "success": True,
@@ -321,255 +2500,855 @@ async def make_outbound_call(request: Request, call_request: OutboundCallRequest
             }
         )
 
+@app.post("/make-calls")
+async def start_outbound_campaign(request: Request, campaign_request: CampaignRequest):
+    """Dial a list of farmers in the background with rate and concurrency limits."""
+    if call_lifecycle.draining:
+        return JSONResponse(status_code=503, content={"success": False, "error": "Server is shutting down"})
+    if not all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER]):
+        return JSONResponse(
+            status_code=500,
+            content={
+                "success": False,
+                "error": "Twilio credentials not configured. Please set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, and TWILIO_PHONE_NUMBER in .env file."
+            }
+        )
+
+    campaign = OutboundCampaign(campaign_request, get_public_base_url(request))
+    outbound_campaigns[campaign.campaign_id] = campaign
+    while len(outbound_campaigns) > MAX_TRACKED_CAMPAIGNS:
+        oldest_id = next(iter(outbound_campaigns))
+        outbound_campaigns.pop(oldest_id).cancel()
+    campaign.start()
+    logger.info("📞 Started campaign %s with %d calls", campaign.campaign_id, len(campaign.results))
+    return JSONResponse(content={"success": True, **campaign.summary()})
+
+@app.get("/campaigns/{campaign_id}")
+async def get_outbound_campaign(campaign_id: str):
+    """Return the progress of a campaign and the status of every number in it."""
+    campaign = outbound_campaigns.get(campaign_id)
+    if campaign is None:
+        return JSONResponse(status_code=404, content={"success": False, "error": "Unknown campaign"})
+    return JSONResponse(content={"success": True, **campaign.summary(), "calls": campaign.results})
+
+@app.post("/campaign-call-status")
+async def campaign_call_status(request: Request):
+    """Twilio status callback for campaign calls; frees the call's concurrency slot when it ends."""
+    form = dict(parse_qsl((await request.body()).decode()))
+    campaign = outbound_campaigns.get(request.query_params.get('campaign_id', ''))
+    if campaign is not None:
+        try:
+            index = int(request.query_params.get('index', ''))
+        except ValueError:
+            index = -1
+        campaign.update_call_status(index, form.get('CallStatus', ''))
+    return Response(status_code=204)
+
+@app.get("/greeting-audio")
+async def greeting_audio():
+    """Serve the pre-rendered greeting played by GREETING_MODE=play."""
+    if not os.path.isfile(GREETING_AUDIO_FILE):
+        return JSONResponse(status_code=404, content={"error": "Greeting audio not configured"})
+    return FileResponse(GREETING_AUDIO_FILE, headers={"Cache-Control": "public, max-age=86400, immutable"})
+
+# Stand-in for the caller's number in cached TwiML. The Stream always carries this parameter, so it
+# is rendered with a closing tag and the real number can be substituted whatever the other parameters.
+PHONE_NUMBER_PLACEHOLDER = '<Parameter name="phone_number" value="__PHONE_NUMBER__" />'
+ADMISSION_ID_PLACEHOLDER = '<Parameter name="admission_id" value="__ADMISSION_ID__" />'
+
+
+@lru_cache(maxsize=256)
+def render_incoming_call_twiml(host: str, port: Optional[int], call_reason: Optional[str], greeting_mode: str) -> str:
+    """Render the TwiML for one host/reason variant; per-caller parameters are spliced in afterwards."""
+    response = VoiceResponse()
+    if port and port not in [80, 443]:
+        authority = f"{host}:{port}"
+    else:
+        authority = host
+
+    if greeting_mode == 'play':
+        response.play(f"https://{authority}/greeting-audio")
+    elif greeting_mode == 'say':
+        # <Say> punctuation to improve text-to-speech flow
+        response.say(
+            "Connected to agrisense voice assistant",
+            voice="Google.en-US-Chirp3-HD-Aoede"
+        )
+        response.pause(length=1)
+        response.say(
+            "O.K. you can start talking!",
+            voice="Google.en-US-Chirp3-HD-Aoede"
+        )
+
+    ws_url = f"wss://{authority}/media-stream"
+    logger.info("🔍 Rendering TwiML for %s (host from %s)", ws_url, 'PUBLIC_URL' if PUBLIC_URL else 'request headers')
+
+    connect = Connect()
+    stream = Stream(url=ws_url)
+    if call_reason:
+        stream.parameter(name="reason", value=call_reason)
+    stream.parameter(name="phone_number", value="__PHONE_NUMBER__")
+    stream.parameter(name="admission_id", value="__ADMISSION_ID__")
+    connect.append(stream)
+    response.append(connect)
+    twiml = str(response)
+    if twiml.count(PHONE_NUMBER_PLACEHOLDER) != 1 or twiml.count(ADMISSION_ID_PLACEHOLDER) != 1:
+        raise RuntimeError("Incoming call TwiML is missing a per-call parameter placeholder")
+    return twiml
+
+class CallAdmission:
+    """Caps live calls at MAX_ACTIVE_CALLS per worker, counting calls across workers via the shared store.
+
+    Each worker reports its connected calls. Calls admitted but not yet connected are kept in the
+    shared store under an ID that reaches the media stream as a Stream parameter, because the
+    stream may be accepted by a different worker from the one that answered /incoming-call.
+    """
+
+    # Calls answered with a media stream but not yet connected hold their place this long
+    PENDING_TTL = 20
+    # How long a queued caller waits on hold before admission is tried again
+    RETRY_SECONDS = 5
+
+    def __init__(self, store, max_active_calls: int = MAX_ACTIVE_CALLS, workers: int = WORKERS):
+        self.store = store
+        self.capacity = max_active_calls * max(workers, 1)
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def local_load(self) -> int:
+        return len(active_call_sessions)
+
+    def load(self) -> int:
+        """Connected calls on every worker plus admitted calls whose stream has not connected yet."""
+        return self.local_load() + self.store.other_workers_call_load(WORKER_ID) + self.store.pending_admissions()
+
+    def try_admit(self) -> tuple[bool, Optional[str]]:
+        """Return whether the call is admitted and the admission ID to pass to its media stream."""
+        if self.capacity <= 0:
+            self.admitted += 1
+            return True, None
+        if self.load() >= self.capacity:
+            return False, None
+        admission_id = uuid.uuid4().hex
+        self.store.add_pending_admission(admission_id, time.time() + self.PENDING_TTL)
+        self.admitted += 1
+        return True, admission_id
+
+    def stream_connected(self, admission_id: Optional[str]):
+        """A media stream started, so its pending admission became an active call."""
+        if admission_id and self.capacity > 0:
+            self.store.remove_pending_admission(admission_id)
+        self.report()
+
+    def report(self):
+        self.store.report_call_load(WORKER_ID, self.local_load())
+
+    async def report_periodically(self):
+        while True:
+            self.report()
+            await asyncio.sleep(5)
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity or None,
+            "load": self.local_load(),
+            "total_load": self.load() if self.capacity > 0 else None,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+
+call_admission = CallAdmission(shared_store)
+
+
+def render_busy_twiml() -> str:
+    response = VoiceResponse()
+    response.say(BUSY_MESSAGE, voice="Google.en-US-Chirp3-HD-Aoede")
+    response.hangup()
+    return str(response)
+
+
+def render_over_capacity_twiml(call_params: dict, waited: int) -> str:
+    """Put the caller on hold and retry admission, or politely end the call once the wait is over."""
+    if waited >= ADMISSION_QUEUE_SECONDS:
+        call_admission.rejected += 1
+        return render_busy_twiml()
+    call_admission.queued += 1
+    response = VoiceResponse()
+    if waited == 0:
+        response.say(HOLD_MESSAGE, voice="Google.en-US-Chirp3-HD-Aoede")
+    response.pause(length=CallAdmission.RETRY_SECONDS)
+    retry_params = {"waited": waited + CallAdmission.RETRY_SECONDS}
+    if call_params.get("reason"):
+        retry_params["reason"] = call_params["reason"]
+    response.redirect(f"/incoming-call?{urlencode(retry_params)}")
+    return str(response)
+
+
 @app.api_route("/incoming-call", methods=["GET", "POST"])
 async def handle_incoming_call(request: Request):
     """Handle incoming call and return TwiML response to connect to Media Stream."""
-    response = VoiceResponse()
     call_reason = request.query_params.get('reason')
     if call_reason:
         call_reason = call_reason[:250]
 
-    # <Say> punctuation to improve text-to-speech flow
-    response.say(
-        "Connected to agrisense voice assistant",
-        voice="Google.en-US-Chirp3-HD-Aoede"
-    )
-    response.pause(length=1)
-    response.say(   
-        "O.K. you can start talking!",
-        voice="Google.en-US-Chirp3-HD-Aoede"
-    )
-    
+    # Twilio sends call details as form fields on POST and as query params on GET
+    call_params = dict(request.query_params)
+    if request.method == "POST":
+        call_params.update(parse_qsl((await request.body()).decode()))
+    # On outbound calls we dialled the farmer, so their number is in To rather than From
+    if call_params.get('Direction', 'inbound').startswith('outbound'):
+        farmer_number = call_params.get('To')
+    else:
+        farmer_number = call_params.get('From')
+    farmer_number = normalize_phone_number(farmer_number) if farmer_number else None
+
+    if call_lifecycle.draining:
+        logger.warning("Turning away call from %s: server is shutting down", farmer_number)
+        return HTMLResponse(content=render_busy_twiml(), media_type="application/xml")
+
+    admitted, admission_id = call_admission.try_admit()
+    if not admitted:
+        try:
+            waited = int(request.query_params.get('waited', 0))
+        except ValueError:
+            waited = ADMISSION_QUEUE_SECONDS
+        logger.warning("Call from %s over capacity (%s live), waited %ss", farmer_number, call_admission.load(), waited)
+        return HTMLResponse(content=render_over_capacity_twiml(call_params, waited), media_type="application/xml")
+
+    # Start waking the backend while Twilio sets up the media stream
+    backend_keep_warm.ensure_running()
+
     # Build WebSocket URL - use PUBLIC_URL if set, otherwise try to detect from request
     ws_host, ws_port = get_public_hostname(request)
-    
-    # Log detected hostname for debugging
-    print(f"🔍 Detected hostname: {ws_host}:{ws_port} (from {'PUBLIC_URL' if PUBLIC_URL else 'request headers'})")
-    print(f"   Request URL: {request.url}")
-    print(f"   Host header: {request.headers.get('Host')}")
-    print(f"   X-Forwarded-Host: {request.headers.get('X-Forwarded-Host')}")
-    
-    if ws_port and ws_port not in [80, 443]:
-        ws_url = f"wss://{ws_host}:{ws_port}/media-stream"
-    else:
-        ws_url = f"wss://{ws_host}/media-stream"
-    
-    print(f"   WebSocket URL: {ws_url}")
-    
-    connect = Connect()
-    stream = Stream(url=ws_url)
-    if call_reason:
-        stream.parameter(name="reason", value=call_reason)
-    connect.append(stream)
-    response.append(connect)
-    return HTMLResponse(content=str(response), media_type="application/xml")
+    twiml = render_incoming_call_twiml(ws_host, ws_port, call_reason, GREETING_MODE)
+    phone_parameter = f'<Parameter name="phone_number" value={quoteattr(farmer_number)} />' if farmer_number else ''
+    # Every answered call gets an ID, so draining can wait for calls still hearing the greeting
+    admission_id = admission_id or uuid.uuid4().hex
+    call_lifecycle.call_answered(admission_id)
+    admission_parameter = f'<Parameter name="admission_id" value="{admission_id}" />'
+    twiml = twiml.replace(PHONE_NUMBER_PLACEHOLDER, phone_parameter, 1).replace(ADMISSION_ID_PLACEHOLDER, admission_parameter, 1)
+    return HTMLResponse(content=twiml, media_type="application/xml")
 
-@app.websocket("/media-stream")
-async def handle_media_stream(websocket: WebSocket):
-    """Handle WebSocket connections between Twilio and OpenAI."""
-    print("Client connected")
-    await websocket.accept()
 
-    async with websockets.connect(
-        f"wss://api.openai.com/v1/realtime?model=gpt-realtime&temperature={TEMPERATURE}",
-        additional_headers={
-            "Authorization": f"Bearer {OPENAI_API_KEY}"
+class CallSession:
+    """Per-call relay state between a Twilio media stream and an OpenAI Realtime connection.
+
+    Only needs objects with Starlette-like ``iter_text``/``send_text``/``send_json`` (Twilio) and
+    websockets-like ``send``/async iteration/``state``/``close`` (OpenAI), so it can be driven by fakes.
+    """
+
+    __slots__ = (
+        "twilio_ws", "openai_ws", "stream_sid", "stream_sid_json", "latest_media_timestamp",
+        "last_assistant_item", "response_start_timestamp_twilio", "response_audio_sent_ms",
+        "marks_outstanding", "packetizer", "call_reason", "session_initialized", "context_applied", "farmer_data_prefetch",
+        "tool_tasks", "tool_semaphore", "tool_outputs_pending_response", "model_responding",
+        "frames_in", "bytes_in", "frames_out", "bytes_out", "marks_sent", "tool_calls", "silence_gate",
+        "turn_speech_stopped_at", "turn_committed_at", "awaiting_first_delta", "awaiting_first_frame",
+        "log_context", "filler_task", "filler_playing_until", "filler_clip_index", "filler_frames",
+        "fillers_cancelled", "inbound_queue", "outbound_queue", "playback_until", "capture",
+    )
+
+    def __init__(self, twilio_ws, openai_ws, session_initialized: bool = True):
+        self.twilio_ws = twilio_ws
+        self.openai_ws = openai_ws
+        # False for a fresh connection, whose whole session is sent once the call's context is known
+        self.session_initialized = session_initialized
+        self.stream_sid: Optional[str] = None
+        self.stream_sid_json = 'null'
+        self.latest_media_timestamp = 0
+        self.last_assistant_item: Optional[str] = None
+        self.response_start_timestamp_twilio: Optional[int] = None
+        # Milliseconds of the current assistant item actually handed to Twilio
+        self.response_audio_sent_ms = 0
+        # Marks sent to Twilio that have not been echoed back yet, i.e. audio still queued for playback
+        self.marks_outstanding = 0
+        self.packetizer = OutboundAudioPacketizer()
+        self.call_reason: Optional[str] = None
+        self.context_applied = False
+        self.farmer_data_prefetch: Optional[asyncio.Task] = None
+        self.tool_tasks: set[asyncio.Task] = set()
+        self.tool_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TOOL_CALLS)
+        self.tool_outputs_pending_response = False
+        self.model_responding = False
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.marks_sent = 0
+        self.tool_calls = 0
+        self.silence_gate = SilenceGate() if SILENCE_SUPPRESSION else None
+        # Per-turn latency tracing (time.perf_counter timestamps)
+        self.turn_speech_stopped_at: Optional[float] = None
+        self.turn_committed_at: Optional[float] = None
+        self.awaiting_first_delta = False
+        self.awaiting_first_frame = False
+        self.log_context = CallLogContext()
+        self.filler_task: Optional[asyncio.Task] = None
+        # time.monotonic() until which filler audio already sent to Twilio is still playing
+        self.filler_playing_until = 0.0
+        self.filler_clip_index = 0
+        self.filler_frames = 0
+        self.fillers_cancelled = 0
+        # Twilio frames are 20 ms; outbound frames are at least OUTBOUND_FRAME_MS
+        self.inbound_queue = RelayQueue("inbound", INBOUND_QUEUE_MS // 20)
+        self.outbound_queue = RelayQueue("outbound", OUTBOUND_QUEUE_MS // max(OUTBOUND_FRAME_MS, FILLER_FRAME_MS))
+        # time.monotonic() at which Twilio will have played everything sent to it so far
+        self.playback_until = 0.0
+        self.capture = CallCapture() if CALL_CAPTURE else None
+
+    def stats(self) -> dict:
+        return {
+            "stream_sid": self.stream_sid,
+            "frames_in": self.frames_in,
+            "bytes_in": self.bytes_in,
+            "frames_out": self.frames_out,
+            "bytes_out": self.bytes_out,
+            "marks_sent": self.marks_sent,
+            "marks_outstanding": self.marks_outstanding,
+            "tool_calls": self.tool_calls,
+            "tool_calls_in_flight": len(self.tool_tasks),
+            "silence_gate": self.silence_gate.stats() if self.silence_gate else None,
+            "filler_frames": self.filler_frames,
+            "fillers_cancelled": self.fillers_cancelled,
+            "inbound_queue": self.inbound_queue.stats(),
+            "outbound_queue": self.outbound_queue.stats(),
         }
-    ) as openai_ws:
-        await initialize_session(openai_ws)
 
-        # Connection specific state
-        stream_sid = None
-        latest_media_timestamp = 0
-        last_assistant_item = None
-        mark_queue = []
-        response_start_timestamp_twilio = None
-        call_reason = None
-        reason_applied = False
-
-        async def apply_call_reason(reason_value: str):
-            nonlocal call_reason, reason_applied
-            if reason_applied:
-                return
+    async def run(self):
+        """Relay in both directions until either side closes, then stop everything the call started."""
+        # Set before the relay tasks are created so they, and the caller's logging, share it
+        call_log_context.set(self.log_context)
+        readers = [asyncio.create_task(self.receive_from_twilio()), asyncio.create_task(self.send_to_twilio())]
+        writers = [asyncio.create_task(self.write_to_openai()), asyncio.create_task(self.write_to_twilio())]
+        try:
+            # Once one socket is gone the other reader would wait on its own socket indefinitely
+            await asyncio.wait(readers, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            tasks = readers + writers + list(self.tool_tasks)
+            if self.farmer_data_prefetch is not None:
+                tasks.append(self.farmer_data_prefetch)
+            if self.filler_task is not None:
+                tasks.append(self.filler_task)
+            for task in tasks:
+                task.cancel()
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(result, Exception):
+                    logger.error("Call task failed: %r", result, exc_info=result)
+            if self.capture is not None:
+                self.capture_event("call.end", stats=self.stats())
+                call_capture_writer.submit(self.capture)
 
-            sanitized_reason = (reason_value or "").strip()
-            if not sanitized_reason:
-                return
+    def openai_send_buffer_size(self) -> int:
+        transport = getattr(self.openai_ws, "transport", None)
+        return transport.get_write_buffer_size() if transport is not None else 0
 
-            reason_applied = True
-            call_reason = sanitized_reason[:250]
+    def _openai_is_open(self) -> bool:
+        return self.openai_ws.state.name == 'OPEN'
 
-            combined_instructions = (
-                f"{SYSTEM_MESSAGE}\n\n"
-                f"The farmer is being contacted for the following reason: {call_reason}. "
-                "Begin by greeting them warmly in Bangla and clearly stating this reason before offering additional help."
-            )
+    def capture_event(self, event_type: str, **fields):
+        if self.capture is not None:
+            self.capture.add_event(self.latest_media_timestamp, event_type, fields)
 
-            session_update_event = {
-                "type": "session.update",
-                "session": {
-                    "instructions": combined_instructions
-                }
+    def capture_clear(self, reason: str):
+        """Note in the capture that Twilio dropped the audio it had buffered."""
+        if self.capture is not None:
+            self.capture.outbound.append((self.latest_media_timestamp, None))
+            self.capture_event("twilio.clear", reason=reason)
+
+    async def hang_up(self, reason):
+        """End the call from our side, closing both sockets."""
+        logger.warning("Ending call: %s", reason)
+        if self._openai_is_open():
+            await self.openai_ws.close()
+        try:
+            await self.twilio_ws.close()
+        except RuntimeError:
+            # Already closed by Twilio
+            pass
+
+    async def apply_call_context(self, reason_value: Optional[str], phone_number: Optional[str]):
+        """Tell the model the caller's number and, for outbound calls, why we are calling.
+
+        This is the call's only session.update: the whole session on a fresh connection, or just
+        the instructions on a pooled one.
+        """
+        if self.context_applied:
+            return
+        self.context_applied = True
+
+        sanitized_reason = (reason_value or "").strip()
+        self.call_reason = sanitized_reason[:250] or None
+        if self.session_initialized and not self.call_reason and not phone_number:
+            return
+
+        session_update = build_session_update(self.call_reason, phone_number, instructions_only=self.session_initialized)
+        await initialize_session(self.openai_ws, session_update)
+        self.session_initialized = True
+        if self.call_reason:
+            # The instructions already tell the model to open with the reason, so it can speak first
+            await self.openai_ws.send('{"type": "response.create"}')
+
+    async def forward_audio(self, timestamp: int, payload: str):
+        """Forward one inbound Twilio audio frame to OpenAI."""
+        started = time.perf_counter()
+        try:
+            await self._forward_audio(timestamp, payload)
+        finally:
+            RELAY_FRAME_OVERHEAD.observe(time.perf_counter() - started, direction="inbound")
+
+    async def _forward_audio(self, timestamp: int, payload: str):
+        self.latest_media_timestamp = timestamp
+        if self.capture is not None:
+            self.capture.inbound.append((timestamp, payload))
+        self.frames_in += 1
+        self.bytes_in += base64_decoded_length(payload)
+        if self.silence_gate is None:
+            self.inbound_queue.put(build_openai_audio_append(payload))
+            return
+        for forwarded_payload in self.silence_gate.process(payload):
+            self.inbound_queue.put(build_openai_audio_append(forwarded_payload))
+
+    async def handle_twilio_event(self, data: dict):
+        """Handle a parsed, non-fast-path Twilio event."""
+        if data['event'] == 'media' and self._openai_is_open():
+            await self.forward_audio(int(data['media']['timestamp']), data['media']['payload'])
+        elif data['event'] == 'start':
+            self.stream_sid = data['start']['streamSid']
+            self.stream_sid_json = json.dumps(self.stream_sid)
+            self.log_context.stream_sid = self.stream_sid
+            self.log_context.call_sid = data['start'].get('callSid') or "-"
+            logger.info("Incoming stream has started %s", self.stream_sid)
+            self.response_start_timestamp_twilio = None
+            self.latest_media_timestamp = 0
+            self.last_assistant_item = None
+            params = data['start'].get('customParameters', {})
+            if self.capture is not None:
+                self.capture.stream_sid = self.stream_sid
+                self.capture.call_sid = data['start'].get('callSid')
+                self.capture_event("call.start", stream_sid=self.stream_sid, call_sid=self.capture.call_sid, parameters=params)
+            if not isinstance(params, dict):
+                params = {}
+            call_lifecycle.stream_started(params.get('admission_id'))
+            call_admission.stream_connected(params.get('admission_id'))
+            phone_number = normalize_phone_number(params.get('phone_number') or '') or None
+            if phone_number:
+                # Warm the tool cache so get_farmer_data is answered without a round trip
+                self.farmer_data_prefetch = asyncio.create_task(
+                    execute_tool("get_farmer_data", {"phone_number": phone_number})
+                )
+            await self.apply_call_context(params.get('reason'), phone_number)
+            if GREETING_MODE == 'stream':
+                self.queue_greeting()
+        elif data['event'] == 'mark':
+            if self.marks_outstanding:
+                self.marks_outstanding -= 1
+
+    async def receive_from_twilio(self):
+        """Receive audio data from Twilio and send it to the OpenAI Realtime API."""
+        try:
+            async for message in self.twilio_ws.iter_text():
+                media = extract_twilio_media(message)
+                if media is not None:
+                    if self._openai_is_open():
+                        await self.forward_audio(*media)
+                    continue
+                await self.handle_twilio_event(json_loads(message))
+        except WebSocketDisconnect:
+            pass
+        except SlowConsumerError as e:
+            await self.hang_up(e)
+            return
+        # Starlette's iter_text() returns quietly when Twilio hangs up, so the disconnect is handled here.
+        # Closing while send_to_twilio() still reads lets the closing handshake complete promptly.
+        logger.info("Client disconnected.")
+        if self._openai_is_open():
+            await self.openai_ws.close()
+
+    async def write_to_openai(self):
+        """Send queued caller audio to OpenAI, so a slow OpenAI socket never stalls reading from Twilio."""
+        try:
+            while True:
+                await self.openai_ws.send(await self.inbound_queue.get())
+        except websockets.ConnectionClosed:
+            pass
+
+    async def handle_openai_event(self, response: dict):
+        """Handle one parsed event from the OpenAI Realtime API."""
+        if response['type'] in LOG_EVENT_TYPES:
+            log_event(logging.INFO, response["type"], "OpenAI event", response)
+        if self.capture is not None and response['type'] in CAPTURE_EVENT_TYPES:
+            self.capture_event(response['type'], **{key: value for key, value in response.items() if key not in ('type', 'event_id')})
+
+        if response.get('type') == 'input_audio_buffer.speech_stopped':
+            self.turn_speech_stopped_at = time.perf_counter()
+        elif response.get('type') == 'input_audio_buffer.committed':
+            self.turn_committed_at = time.perf_counter()
+            self.awaiting_first_delta = True
+            self.awaiting_first_frame = self.turn_speech_stopped_at is not None
+
+        if response.get('type') == 'response.created':
+            self.model_responding = True
+        elif response.get('type') == 'response.done':
+            self.model_responding = False
+            await self.request_response_if_ready()
+
+        # Handle function calls in the background so audio keeps flowing
+        if response.get('type') == 'response.function_call_arguments.done':
+            function_name = response.get('name')
+            call_id = response.get('call_id')
+            try:
+                arguments = json.loads(response.get('arguments') or '{}')
+            except json.JSONDecodeError:
+                arguments = None
+            if not isinstance(arguments, dict):
+                logger.warning("Arguments for %s are not a JSON object: %.200s", function_name, response.get('arguments'))
+                arguments = None
+
+            self.tool_calls += 1
+            task = asyncio.create_task(self.run_tool_call(function_name, call_id, arguments))
+            self.tool_tasks.add(task)
+            task.add_done_callback(self._tool_task_done)
+            if filler_clips and (self.filler_task is None or self.filler_task.done()):
+                self.filler_task = asyncio.create_task(self.play_filler())
+
+        if response.get('type') == 'response.output_audio.delta' and 'delta' in response:
+            started = time.perf_counter()
+            await self.stop_filler()
+            if self.awaiting_first_delta:
+                self.awaiting_first_delta = False
+                OPENAI_FIRST_DELTA.observe(started - self.turn_committed_at)
+            if response.get("item_id") and response["item_id"] != self.last_assistant_item:
+                # Audio still buffered for the previous item must go out before the new one starts
+                self.queue_audio_chunk(self.packetizer.flush())
+                self.response_start_timestamp_twilio = self.latest_media_timestamp
+                self.response_audio_sent_ms = 0
+                self.last_assistant_item = response["item_id"]
+                logger.debug("Setting start timestamp for new response: %sms", self.response_start_timestamp_twilio)
+
+            # The delta is already base64 μ-law; small ones are coalesced into one frame and one mark
+            self.queue_audio_chunk(self.packetizer.push(response['delta']))
+            RELAY_FRAME_OVERHEAD.observe(time.perf_counter() - started, direction="outbound")
+
+        if response.get('type') in ('response.output_audio.done', 'response.done'):
+            self.queue_audio_chunk(self.packetizer.flush())
+
+        # Trigger an interruption. Your use case might work better using `input_audio_buffer.speech_stopped`, or combining the two.
+        if response.get('type') == 'input_audio_buffer.speech_started':
+            await self.stop_filler()
+            if self.last_assistant_item:
+                logger.info("Interrupting response with id: %s", self.last_assistant_item)
+                await self.handle_speech_started_event()
+
+    async def send_to_twilio(self):
+        """Receive events from the OpenAI Realtime API, send audio back to Twilio."""
+        try:
+            async for openai_message in self.openai_ws:
+                await self.handle_openai_event(json_loads(openai_message))
+        except SlowConsumerError as e:
+            await self.hang_up(e)
+        except Exception as e:
+            logger.exception("Error in send_to_twilio: %s", e)
+
+    async def write_to_twilio(self):
+        """Send queued audio to Twilio at real-time pace, OUTBOUND_LEAD_MS ahead of playback."""
+        lead = OUTBOUND_LEAD_MS / 1000
+        try:
+            while True:
+                payload, source = await self.outbound_queue.get()
+                generation = self.outbound_queue.generation
+                delay = self.playback_until - lead - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    if self.outbound_queue.generation != generation:
+                        # An interruption cleared the queue while this frame was waiting
+                        continue
+                await self.twilio_ws.send_text(build_twilio_media_message(self.stream_sid_json, payload))
+                if self.capture is not None:
+                    self.capture.outbound.append((self.latest_media_timestamp, payload))
+                payload_bytes = base64_decoded_length(payload)
+                self.playback_until = max(self.playback_until, time.monotonic()) + payload_bytes / MULAW_BYTES_PER_MS / 1000
+                self.frames_out += 1
+                self.bytes_out += payload_bytes
+                if source == "response":
+                    await self.response_frame_sent(payload_bytes)
+                elif source == "filler":
+                    self.filler_playing_until = self.playback_until
+                    self.filler_frames += 1
+        except Exception as e:
+            logger.warning("Twilio writer stopped: %s", e)
+
+    async def run_tool_call(self, function_name: str, call_id: str, arguments: Optional[dict]):
+        """Execute one tool call and post its output back to OpenAI.
+
+        An output is always posted, even when the arguments are unusable or the tool raises, since
+        the model waits for one before it carries on.
+        """
+        # The model picks the name, so only registered tools get their own label
+        tool_label = function_name if function_name in TOOL_REGISTRY else "unknown"
+        try:
+            if arguments is None:
+                result = {"success": False, "error": "The function arguments were not a valid JSON object."}
+            else:
+                async with self.tool_semaphore:
+                    started = time.perf_counter()
+                    result = await execute_tool(function_name, arguments)
+                    TOOL_LATENCY.observe(time.perf_counter() - started, tool=tool_label)
+            log_event(logging.INFO, "tool.result", f"Tool result: {function_name}", result)
+            output = shape_tool_result(TOOL_REGISTRY.get(function_name), result)
+        except Exception as e:
+            logger.exception("Tool %s failed", function_name)
+            output = json.dumps({"success": False, "error": f"The tool failed unexpectedly: {e}"})
+        TOOL_OUTPUT_SIZE.observe(len(output), tool=tool_label)
+        self.capture_event("tool.result", name=function_name, call_id=call_id, output=output)
+        function_output_event = {
+            "type": "conversation.item.create",
+            "item": {
+                "type": "function_call_output",
+                "call_id": call_id,
+                "output": output
             }
-            await openai_ws.send(json.dumps(session_update_event))
-
-            reason_message_event = {
-                "type": "conversation.item.create",
-                "item": {
-                    "type": "message",
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": (
-                                f"Call reason: {call_reason}. Greet the farmer in Bangla and clearly explain this reason before offering more help."
-                            )
-                        }
-                    ]
+        }
+        try:
+            await self.openai_ws.send(json.dumps(function_output_event))
+            self.tool_outputs_pending_response = True
+            self.tool_tasks.discard(asyncio.current_task())
+            await self.request_response_if_ready()
+        except websockets.ConnectionClosed:
+            pass
+
+    def _tool_task_done(self, task: asyncio.Task):
+        # The task leaves tool_tasks here, before run() could gather it, so its error is logged here
+        self.tool_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Tool task failed: %r", task.exception(), exc_info=task.exception())
+
+    async def request_response_if_ready(self):
+        """Ask for a new response once every tool of the last response has reported back."""
+        if self.tool_outputs_pending_response and not self.tool_tasks and not self.model_responding:
+            self.tool_outputs_pending_response = False
+            await self.openai_ws.send(json.dumps({"type": "response.create"}))
+
+    async def handle_speech_started_event(self):
+        """Handle interruption when the caller's speech starts."""
+        # Audio still held by the packetizer or queued for Twilio was never played, so it is simply dropped
+        self.packetizer.clear()
+        unsent_frames = self.outbound_queue.clear()
+        if (self.marks_outstanding or unsent_frames) and self.response_start_timestamp_twilio is not None:
+            # The caller cannot have heard more audio than was actually sent
+            elapsed_time = min(
+                self.latest_media_timestamp - self.response_start_timestamp_twilio,
+                self.response_audio_sent_ms,
+            )
+            logger.debug(
+                "Calculating elapsed time for truncation: %s - %s = %sms",
+                self.latest_media_timestamp, self.response_start_timestamp_twilio, elapsed_time,
+            )
+
+            if self.last_assistant_item:
+                logger.debug("Truncating item with ID: %s, Truncated at: %sms", self.last_assistant_item, elapsed_time)
+
+                truncate_event = {
+                    "type": "conversation.item.truncate",
+                    "item_id": self.last_assistant_item,
+                    "content_index": 0,
+                    "audio_end_ms": elapsed_time
                 }
+                await self.openai_ws.send(json.dumps(truncate_event))
+                self.capture_event("conversation.item.truncate", item_id=self.last_assistant_item, audio_end_ms=elapsed_time)
+
+            await self.twilio_ws.send_json({
+                "event": "clear",
+                "streamSid": self.stream_sid
+            })
+            self.playback_until = 0.0
+            self.capture_clear("interruption")
+
+            self.marks_outstanding = 0
+            self.last_assistant_item = None
+            self.response_start_timestamp_twilio = None
+
+    async def play_filler(self):
+        """Queue filler clips while tool calls run, starting after FILLER_DELAY_MS."""
+        await asyncio.sleep(FILLER_DELAY_MS / 1000)
+        while self.tool_tasks:
+            if self.marks_outstanding or self.outbound_queue:
+                # Let the model's own audio finish playing first
+                await asyncio.sleep(FILLER_FRAME_MS / 1000)
+                continue
+            clip = filler_clips[self.filler_clip_index % len(filler_clips)]
+            self.filler_clip_index += 1
+            for payload in clip:
+                self.outbound_queue.put((payload, "filler"))
+            # The Twilio writer paces the clip, so it has finished playing after its own length
+            await asyncio.sleep((len(clip) * FILLER_FRAME_MS + FILLER_GAP_MS) / 1000)
+
+    async def stop_filler(self):
+        """Stop filler audio, dropping what is queued and clearing whatever Twilio has buffered of it."""
+        if self.filler_task is not None and not self.filler_task.done():
+            self.filler_task.cancel()
+        queued = self.outbound_queue.peek()
+        if queued is not None and queued[1] == "filler":
+            # Filler is only queued behind nothing else, and response audio only after it is stopped
+            self.outbound_queue.clear()
+        if self.filler_playing_until > time.monotonic():
+            self.fillers_cancelled += 1
+            await self.twilio_ws.send_json({"event": "clear", "streamSid": self.stream_sid})
+            self.playback_until = 0.0
+            self.capture_clear("filler")
+        self.filler_playing_until = 0.0
+
+    def queue_greeting(self):
+        """Play the pre-encoded greeting straight into the stream while the model gets ready."""
+        for payload in greeting_frames:
+            self.outbound_queue.put((payload, "greeting"))
+
+    def queue_audio_chunk(self, payload: Optional[str]):
+        """Queue one coalesced response frame for the Twilio writer."""
+        if payload:
+            self.outbound_queue.put((payload, "response"))
+
+    async def response_frame_sent(self, payload_bytes: int):
+        """Account for a response frame the Twilio writer sent, and follow it with a single mark."""
+        if self.awaiting_first_frame:
+            self.awaiting_first_frame = False
+            TIME_TO_FIRST_AUDIO.observe(time.perf_counter() - self.turn_speech_stopped_at)
+            self.turn_speech_stopped_at = None
+        self.response_audio_sent_ms += payload_bytes // MULAW_BYTES_PER_MS
+        await self.send_mark()
+
+    async def send_mark(self):
+        if self.stream_sid:
+            mark_event = {
+                "event": "mark",
+                "streamSid": self.stream_sid,
+                "mark": {"name": "responsePart"}
             }
-            await openai_ws.send(json.dumps(reason_message_event))
-            await openai_ws.send(json.dumps({"type": "response.create"}))
-        
-        async def receive_from_twilio():
-            """Receive audio data from Twilio and send it to the OpenAI Realtime API."""
-            nonlocal stream_sid, latest_media_timestamp
-            try:
-                async for message in websocket.iter_text():
-                    data = json.loads(message)
-                    if data['event'] == 'media' and openai_ws.state.name == 'OPEN':
-                        latest_media_timestamp = int(data['media']['timestamp'])
-                        audio_append = {
-                            "type": "input_audio_buffer.append",
-                            "audio": data['media']['payload']
-                        }
-                        await openai_ws.send(json.dumps(audio_append))
-                    elif data['event'] == 'start':
-                        stream_sid = data['start']['streamSid']
-                        print(f"Incoming stream has started {stream_sid}")
-                        response_start_timestamp_twilio = None
-                        latest_media_timestamp = 0
-                        last_assistant_item = None
-                        params = data['start'].get('customParameters', {})
-                        if isinstance(params, dict):
-                            potential_reason = params.get('reason')
-                            if potential_reason:
-                                await apply_call_reason(potential_reason)
-                    elif data['event'] == 'mark':
-                        if mark_queue:
-                            mark_queue.pop(0)
-            except WebSocketDisconnect:
-                print("Client disconnected.")
-                if openai_ws.state.name == 'OPEN':
-                    await openai_ws.close()
-
-        async def send_to_twilio():
-            """Receive events from the OpenAI Realtime API, send audio back to Twilio."""
-            nonlocal stream_sid, last_assistant_item, response_start_timestamp_twilio
-            try:
-                async for openai_message in openai_ws:
-                    response = json.loads(openai_message)
-                    if response['type'] in LOG_EVENT_TYPES:
-                        print(f"Received event: {response['type']}", response)
-
-                    # Handle function calls
-                    if response.get('type') == 'response.function_call_arguments.done':
-                        print(f"Function call detected: {response}")
-                        function_name = response.get('name')
-                        call_id = response.get('call_id')
-                        try:
-                            arguments = json.loads(response.get('arguments', '{}'))
-                        except json.JSONDecodeError:
-                            arguments = {}
-                        
-                        # Execute the tool
-                        result = await execute_tool(function_name, arguments)
-                        print(f"Tool result: {result}")
-                        
-                        # Send the result back to OpenAI
-                        function_output_event = {
-                            "type": "conversation.item.create",
-                            "item": {
-                                "type": "function_call_output",
-                                "call_id": call_id,
-                                "output": json.dumps(result)
-                            }
-                        }
-                        await openai_ws.send(json.dumps(function_output_event))
-                        
-                        # Trigger a new response from the assistant
-                        await openai_ws.send(json.dumps({"type": "response.create"}))
-
-                    if response.get('type') == 'response.output_audio.delta' and 'delta' in response:
-                        audio_payload = base64.b64encode(base64.b64decode(response['delta'])).decode('utf-8')
-                        audio_delta = {
-                            "event": "media",
-                            "streamSid": stream_sid,
-                            "media": {
-                                "payload": audio_payload
-                            }
-                        }
-                        await websocket.send_json(audio_delta)
-
-
-                        if response.get("item_id") and response["item_id"] != last_assistant_item:
-                            response_start_timestamp_twilio = latest_media_timestamp
-                            last_assistant_item = response["item_id"]
-                            if SHOW_TIMING_MATH:
-                                print(f"Setting start timestamp for new response: {response_start_timestamp_twilio}ms")
-
-                        await send_mark(websocket, stream_sid)
-
-                    # Trigger an interruption. Your use case might work better using `input_audio_buffer.speech_stopped`, or combining the two.
-                    if response.get('type') == 'input_audio_buffer.speech_started':
-                        print("Speech started detected.")
-                        if last_assistant_item:
-                            print(f"Interrupting response with id: {last_assistant_item}")
-                            await handle_speech_started_event()
-            except Exception as e:
-                print(f"Error in send_to_twilio: {e}")
-
-        async def handle_speech_started_event():
-            """Handle interruption when the caller's speech starts."""
-            nonlocal response_start_timestamp_twilio, last_assistant_item
-            print("Handling speech started event.")
-            if mark_queue and response_start_timestamp_twilio is not None:
-                elapsed_time = latest_media_timestamp - response_start_timestamp_twilio
-                if SHOW_TIMING_MATH:
-                    print(f"Calculating elapsed time for truncation: {latest_media_timestamp} - {response_start_timestamp_twilio} = {elapsed_time}ms")
-
-                if last_assistant_item:
-                    if SHOW_TIMING_MATH:
-                        print(f"Truncating item with ID: {last_assistant_item}, Truncated at: {elapsed_time}ms")
-
-                    truncate_event = {
-                        "type": "conversation.item.truncate",
-                        "item_id": last_assistant_item,
-                        "content_index": 0,
-                        "audio_end_ms": elapsed_time
-                    }
-                    await openai_ws.send(json.dumps(truncate_event))
-
-                await websocket.send_json({
-                    "event": "clear",
-                    "streamSid": stream_sid
-                })
-
-                mark_queue.clear()
-                last_assistant_item = None
-                response_start_timestamp_twilio = None
-
-        async def send_mark(connection, stream_sid):
-            if stream_sid:
-                mark_event = {
-                    "event": "mark",
-                    "streamSid": stream_sid,
-                    "mark": {"name": "responsePart"}
-                }
-                await connection.send_json(mark_event)
-                mark_queue.append('responsePart')
+            await self.twilio_ws.send_json(mark_event)
+            self.marks_outstanding += 1
+            self.marks_sent += 1
+
 
-        await asyncio.gather(receive_from_twilio(), send_to_twilio())
+# Sessions for calls currently in progress, for monitoring
+active_call_sessions: set[CallSession] = set()
+
+
+class CallLifecycle:
+    """Lets calls in progress finish before the process exits.
+
+    uvicorn closes every WebSocket as soon as it is told to stop, so SIGTERM is handled here first:
+    new calls and campaigns are turned away, live calls get DRAIN_TIMEOUT seconds to end, the rest
+    are hung up, and only then is the signal handed back to uvicorn for its normal shutdown. A
+    second SIGTERM skips the wait.
+    """
+
+    def __init__(self, sessions: set[CallSession], drain_timeout: float = DRAIN_TIMEOUT):
+        self.sessions = sessions
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        # Media streams accepted but still waiting for their Realtime connection
+        self.connecting = 0
+        # Calls answered with TwiML whose media stream has not started yet (e.g. still in the greeting),
+        # by the ID passed to the stream, with the time.monotonic() they were answered at
+        self._answered: dict[str, float] = {}
+        self.calls_hung_up = 0
+        self._skip_wait = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._previous_handler = None
+        self._drain_task: Optional[asyncio.Task] = None
+
+    def install_signal_handler(self):
+        # Signal handlers can only be installed from the main thread, which is not the case under test clients
+        if threading.current_thread() is not threading.main_thread():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._previous_handler = signal.signal(signal.SIGTERM, self._handle_sigterm)
+
+    def _handle_sigterm(self, signum, frame):
+        self._loop.call_soon_threadsafe(self.start_draining)
+
+    def call_answered(self, call_id: str):
+        self._answered[call_id] = time.monotonic()
+
+    def stream_started(self, call_id: Optional[str]):
+        if call_id:
+            self._answered.pop(call_id, None)
+
+    def answered_calls(self) -> int:
+        """Calls answered here whose stream has not started; ones that never connect expire."""
+        cutoff = time.monotonic() - CallAdmission.PENDING_TTL
+        for call_id in [call_id for call_id, answered_at in self._answered.items() if answered_at < cutoff]:
+            del self._answered[call_id]
+        return len(self._answered)
+
+    def start_draining(self):
+        if self.draining:
+            self._skip_wait = True
+            return
+        self.draining = True
+        for campaign in outbound_campaigns.values():
+            campaign.cancel()
+        self._drain_task = asyncio.create_task(self._drain())
+
+    async def _drain(self):
+        logger.info(
+            "🛑 Draining %d call(s) for up to %ss before shutting down",
+            len(self.sessions) + self.connecting + self.answered_calls(), self.drain_timeout,
+        )
+        deadline = time.monotonic() + self.drain_timeout
+        while ((self.sessions or self.connecting or self.answered_calls())
+               and not self._skip_wait and time.monotonic() < deadline):
+            await asyncio.sleep(0.5)
+        await self.close_sessions("server shutting down")
+        signal.signal(signal.SIGTERM, self._previous_handler or signal.SIG_DFL)
+        signal.raise_signal(signal.SIGTERM)
+
+    async def close_sessions(self, reason: str, timeout: float = 10):
+        """Hang up every call still in progress and give their relays time to stop."""
+        deadline = time.monotonic() + timeout
+        while self.connecting and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for session in list(self.sessions):
+            self.calls_hung_up += 1
+            await session.hang_up(reason)
+        while self.sessions and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+    def stats(self) -> dict:
+        return {
+            "draining": self.draining,
+            "drain_timeout": self.drain_timeout,
+            "calls_hung_up": self.calls_hung_up,
+            "calls_answered_not_streaming": self.answered_calls(),
+        }
+
+
+call_lifecycle = CallLifecycle(active_call_sessions)
+
+
+@app.websocket("/media-stream")
+async def handle_media_stream(websocket: WebSocket):
+    """Handle WebSocket connections between Twilio and OpenAI."""
+    logger.info("Client connected")
+    await websocket.accept()
+
+    backend_keep_warm.ensure_running()
+    call_lifecycle.connecting += 1
+    try:
+        openai_ws, session_initialized = await realtime_pool.acquire()
+    finally:
+        call_lifecycle.connecting -= 1
+    session = CallSession(websocket, openai_ws, session_initialized)
+    active_call_sessions.add(session)
+    try:
+        await session.run()
+    finally:
+        active_call_sessions.discard(session)
+        call_admission.report()
+        await openai_ws.close()
+        logger.info("Call ended", extra={"fields": session.stats()})
 
 async def send_initial_conversation_item(openai_ws):
     """Send initial conversation item if AI talks first."""
@@ -590,35 +3369,18 @@ async def send_initial_conversation_item(openai_ws):
     await openai_ws.send(json.dumps({"type": "response.create"}))
 
 
-async def initialize_session(openai_ws):
+async def initialize_session(openai_ws, session_update: str = BASE_SESSION_UPDATE):
     """Control initial session with OpenAI."""
-    session_update = {
-        "type": "session.update",
-        "session": {
-            "type": "realtime",
-            "model": "gpt-realtime",
-            "output_modalities": ["audio"],
-            "audio": {
-                "input": {
-                    "format": {"type": "audio/pcmu"},
-                    "turn_detection": {"type": "server_vad"}
-                },
-                "output": {
-                    "format": {"type": "audio/pcmu"},
-                    "voice": VOICE
-                }
-            },
-            "instructions": SYSTEM_MESSAGE,
-            "tools": TOOLS,
-            "tool_choice": "auto"
-        }
-    }
-    print('Sending session update:', json.dumps(session_update))
-    await openai_ws.send(json.dumps(session_update))
+    log_event(logging.DEBUG, "session.update", "Sending session update", session_update)
+    await openai_ws.send(session_update)
 
     # Uncomment the next line to have the AI speak first
     # await send_initial_conversation_item(openai_ws)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
+    if WORKERS > 1:
+        # Workers are separate processes, so uvicorn needs an import string rather than the app
+        uvicorn.run("main:app", host="0.0.0.0", port=PORT, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=PORT)
@@ -0,0 +1,55 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import main  # noqa: E402
+
+PHONE_NUMBER = "+8801788040850"
+ADD_RICE = {"phone_number": PHONE_NUMBER, "product_name": "rice", "unit_price": 30, "unit": "kg"}
+DELETE_RICE = {"phone_number": PHONE_NUMBER, "product_id": "p1"}
+
+
+def run_call(monkeypatch, calls: list[tuple[str, dict]]) -> tuple[list, list[str]]:
+    """Run tool calls in order within one call; return their results and the writes that reached the backend."""
+    backend_writes = []
+
+    async def fake_call_http_tool(tool, arguments, idempotency_key=None):
+        backend_writes.append(tool.name)
+        return {"success": True, "data": {}}
+
+    monkeypatch.setattr(main, "call_http_tool", fake_call_http_tool)
+    monkeypatch.setattr(main, "write_deduplicator", main.WriteDeduplicator(window=120))
+
+    async def scenario():
+        context = main.CallLogContext()
+        context.call_sid = "CA0000000000000000000000000000test"
+        main.call_log_context.set(context)
+        return [await main.execute_tool(name, arguments) for name, arguments in calls]
+
+    return asyncio.run(scenario()), backend_writes
+
+
+def test_repeated_write_reaches_backend_once(monkeypatch):
+    results, backend_writes = run_call(monkeypatch, [
+        ("add_product_to_selling_list", ADD_RICE),
+        ("add_product_to_selling_list", {**ADD_RICE, "product_name": " Rice ", "unit_price": 30.0}),
+    ])
+
+    assert backend_writes == ["add_product_to_selling_list"]
+    assert results[1]["duplicate"] is True
+
+
+def test_write_after_delete_is_not_a_duplicate(monkeypatch):
+    results, backend_writes = run_call(monkeypatch, [
+        ("add_product_to_selling_list", ADD_RICE),
+        ("delete_product_from_selling_list", DELETE_RICE),
+        ("add_product_to_selling_list", ADD_RICE),
+    ])
+
+    assert backend_writes == [
+        "add_product_to_selling_list", "delete_product_from_selling_list", "add_product_to_selling_list",
+    ]
+    assert "duplicate" not in results[2]